@@ -2,15 +2,19 @@ from __future__ import annotations
 
 import argparse
 import os
+import sys
+from functools import lru_cache
+from typing import Dict, List, Optional
 
-from dotenv import load_dotenv
 
-from app.auth import hash_password
-from app.tenant_store import init_db, create_user, get_user_by_email
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    from dotenv import load_dotenv
 
-
-def main() -> int:
     load_dotenv()
+
+
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Admin CLI for control DB")
     sub = parser.add_subparsers(dest="cmd", required=True)
 
@@ -19,22 +23,72 @@ def main() -> int:
     su_cmd = sub.add_parser("create-superuser", help="Create a superuser account")
     su_cmd.add_argument("--email", required=True)
     su_cmd.add_argument("--password", required=True)
+    return parser
+
+
+def _parse_options(argv: List[str], names: tuple[str, ...]) -> Optional[Dict[str, str]]:
+    """
+    Parse `--name value` / `--name=value` pairs. Returns None on anything
+    unexpected so the caller can fall back to argparse for the error message.
+    """
+    opts: Dict[str, str] = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if not arg.startswith("--"):
+            return None
+        key, eq, value = arg[2:].partition("=")
+        if key not in names:
+            return None
+        if not eq:
+            if i + 1 >= len(argv):
+                return None
+            i += 1
+            value = argv[i]
+        opts[key] = value
+        i += 1
+    if any(n not in opts for n in names):
+        return None
+    return opts
 
-    args = parser.parse_args()
 
-    if args.cmd == "init-db":
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Hand-rolled dispatch for the two known commands; argparse is only built
+    # for --help and bad input, where its messages are worth the startup cost.
+    cmd = argv[0] if argv else None
+    opts: Optional[Dict[str, str]] = None
+    if cmd == "init-db" and len(argv) == 1:
+        opts = {}
+    elif cmd == "create-superuser":
+        opts = _parse_options(argv[1:], ("email", "password"))
+    if opts is None:
+        args = _build_parser().parse_args(argv)
+        cmd = args.cmd
+        opts = {k: v for k, v in vars(args).items() if k != "cmd"}
+
+    # tenant_store reads CONTROL_DB_PATH at import time, so load .env first.
+    _load_env()
+
+    if cmd == "init-db":
+        from app.tenant_store import init_db
+
         init_db()
         print("Control DB initialized.")
         return 0
 
-    if args.cmd == "create-superuser":
+    if cmd == "create-superuser":
+        from app.auth import hash_password
+        from app.tenant_store import init_db, create_user, get_user_by_email
+
         init_db()
-        existing = get_user_by_email(args.email)
+        existing = get_user_by_email(opts["email"])
         if existing:
             print("User already exists.")
             return 1
-        pwd_hash = hash_password(args.password)
-        create_user(args.email, pwd_hash, role="superuser", dsn_id=None)
+        pwd_hash = hash_password(opts["password"])
+        create_user(opts["email"], pwd_hash, role="superuser", dsn_id=None)
         print("Superuser created.")
         return 0
 
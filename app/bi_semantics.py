@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Literal, List, Dict
+from types import MappingProxyType
+from typing import Optional, Literal, List, Mapping
 
 from app.schema_pack import SCHEMA
 
@@ -15,7 +16,7 @@ MetricType = Literal[
 ]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MetricDef:
     key: MetricType
     description: str
@@ -25,6 +26,50 @@ class MetricDef:
     extra_filters: List[str]
 
 
+# Built once at import; read-only so every BISemantics shares it safely.
+_METRICS: Mapping[MetricType, MetricDef] = MappingProxyType({
+    "gross_sales": MetricDef(
+        key="gross_sales",
+        description="Total sales based on sales.total (restaurant-scoped).",
+        base_table="sales",
+        expression_sql="SUM(sales.total)",
+        extra_filters=[
+            # We will refine this in Module 3 once you confirm the exact sale_state values.
+            # For now, keep it permissive to avoid excluding valid revenue.
+            # Example later: "sales.sale_state = 'paid'"
+        ],
+    ),
+    "item_revenue": MetricDef(
+        key="item_revenue",
+        description="Line-item revenue based on items.price * items.quantity (excluding canceled items).",
+        base_table="items",
+        expression_sql="SUM(items.price * items.quantity)",
+        extra_filters=[],
+    ),
+    "covers": MetricDef(
+        key="covers",
+        description="Total covers/guests based on sales.num_customers.",
+        base_table="sales",
+        expression_sql="SUM(sales.num_customers)",
+        extra_filters=[],
+    ),
+    "expense_total": MetricDef(
+        key="expense_total",
+        description="Total operational expenses based on expenses.amount (excluding canceled expenses).",
+        base_table="expenses",
+        expression_sql="SUM(expenses.amount)",
+        extra_filters=[],
+    ),
+    "payment_total": MetricDef(
+        key="payment_total",
+        description="Total payments collected based on payments.amount (excluding canceled payments).",
+        base_table="payments",
+        expression_sql="SUM(payments.amount)",
+        extra_filters=[],
+    ),
+})
+
+
 class BISemantics:
     """
     Canonical business logic. The agent should always prefer these
@@ -32,47 +77,7 @@ class BISemantics:
     """
 
     def __init__(self) -> None:
-        self.metrics: Dict[MetricType, MetricDef] = {
-            "gross_sales": MetricDef(
-                key="gross_sales",
-                description="Total sales based on sales.total (restaurant-scoped).",
-                base_table="sales",
-                expression_sql="SUM(sales.total)",
-                extra_filters=[
-                    # We will refine this in Module 3 once you confirm the exact sale_state values.
-                    # For now, keep it permissive to avoid excluding valid revenue.
-                    # Example later: "sales.sale_state = 'paid'"
-                ],
-            ),
-            "item_revenue": MetricDef(
-                key="item_revenue",
-                description="Line-item revenue based on items.price * items.quantity (excluding canceled items).",
-                base_table="items",
-                expression_sql="SUM(items.price * items.quantity)",
-                extra_filters=[],
-            ),
-            "covers": MetricDef(
-                key="covers",
-                description="Total covers/guests based on sales.num_customers.",
-                base_table="sales",
-                expression_sql="SUM(sales.num_customers)",
-                extra_filters=[],
-            ),
-            "expense_total": MetricDef(
-                key="expense_total",
-                description="Total operational expenses based on expenses.amount (excluding canceled expenses).",
-                base_table="expenses",
-                expression_sql="SUM(expenses.amount)",
-                extra_filters=[],
-            ),
-            "payment_total": MetricDef(
-                key="payment_total",
-                description="Total payments collected based on payments.amount (excluding canceled payments).",
-                base_table="payments",
-                expression_sql="SUM(payments.amount)",
-                extra_filters=[],
-            ),
-        }
+        self.metrics: Mapping[MetricType, MetricDef] = _METRICS
 
     def metric(self, key: MetricType) -> MetricDef:
         return self.metrics[key]
@@ -3,13 +3,31 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import sys
+from functools import lru_cache
 from typing import Any
 
-from dotenv import load_dotenv
 
-from app.llm_planner import question_to_sql
-from app.db import run_select, DatabaseError
-from app.verbalizer import verbalize_answer
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def _write_json_rows(rows: list[dict[str, Any]]) -> None:
+    import orjson
+
+    # Dates/Decimals go through str() as before; orjson writes bytes straight
+    # to stdout instead of building an indented str first.
+    data = orjson.dumps(
+        rows,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_PASSTHROUGH_DATETIME,
+        default=str,
+    )
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data + b"\n")
+    sys.stdout.buffer.flush()
 
 
 def _default_restaurant() -> str:
@@ -17,7 +35,6 @@ def _default_restaurant() -> str:
 
 
 def main() -> int:
-    load_dotenv()
     parser = argparse.ArgumentParser(description="Ask the Restaurant BI Agent from the terminal.")
     parser.add_argument("question", help="Question in English, e.g. 'gross sales last 7 days'")
     parser.add_argument("--restaurant", default=None, help="Restaurant name (defaults to DEFAULT_RESTAURANT)")
@@ -26,6 +43,13 @@ def main() -> int:
     parser.add_argument("--include-data", action="store_true", help="Print raw rows")
     args = parser.parse_args()
 
+    # Heavy imports (openai, sqlglot, psycopg) only once we know we'll need them,
+    # so --help and usage errors stay fast.
+    _load_env()
+    from app.llm_planner import question_to_sql
+    from app.db import run_select, DatabaseError
+    from app.verbalizer import verbalize_answer
+
     restaurant = args.restaurant or _default_restaurant()
 
     plan = question_to_sql(args.question, restaurant=restaurant)
@@ -35,6 +59,7 @@ def main() -> int:
             params={"restaurant": restaurant},
             preview=not args.no_preview,
             statement_timeout_ms=int(os.getenv("STATEMENT_TIMEOUT_MS_ASK", "30000")),
+            pooled=False,
         )
     except DatabaseError as e:
         print(f"DB error: {e}")
@@ -52,7 +77,7 @@ def main() -> int:
 
     if args.include_data:
         print("\nRows:")
-        print(json.dumps(rows, indent=2, default=str))
+        _write_json_rows(rows)
 
     return 0
 
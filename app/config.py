@@ -11,6 +11,15 @@ class Settings(BaseSettings):
     max_returned_rows: int = Field(default=5000, alias="MAX_RETURNED_ROWS")
     default_preview_limit: int = Field(default=200, alias="DEFAULT_PREVIEW_LIMIT")
 
+    pool_min_size: int = Field(default=2, alias="PG_POOL_MIN")
+    pool_max_size: int = Field(default=10, alias="PG_POOL_MAX")
+    # get_pool waits this long for the first PG_POOL_MIN connections, so a
+    # bad DSN fails at open instead of on the first query's pool timeout.
+    pool_open_timeout_s: float = Field(default=5.0, alias="PG_POOL_OPEN_TIMEOUT_S")
+    # psycopg prepares a query server-side after this many runs on a
+    # connection; negative disables it (pgbouncer in transaction mode).
+    prepare_threshold: int = Field(default=2, alias="PG_PREPARE_THRESHOLD")
+
     allowed_schemas: str = Field(default="public", alias="ALLOWED_SCHEMAS")
 
     def allowed_schema_set(self) -> set[str]:
@@ -2,10 +2,13 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
 
+import atexit
 import os
+import threading
+from contextlib import nullcontext
 import psycopg
-from psycopg import connect
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
 
 from app.config import settings
 from app.sql_safety import validate_select_only, ensure_limit, UnsafeSQL
@@ -15,40 +18,117 @@ class DatabaseError(Exception):
     pass
 
 
+# One pool per DSN (the Telegram bot routes each user to their own DSN).
+# If the DSN already points at pgbouncer, keep PG_POOL_MAX small: stacking
+# a client-side pool on top of a transaction pooler buys nothing.
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _configure_connection(conn: psycopg.Connection) -> None:
+    # Session-level default timeout, so run_select only needs a SET LOCAL
+    # round trip when the caller asks for something different.
+    conn.execute(f"SET statement_timeout = {int(settings.statement_timeout_ms)}")
+    conn.commit()
+
+
+def _connect_kwargs() -> Dict[str, Any]:
+    return {
+        "row_factory": dict_row,
+        # Builder templates and cached LLM plans repeat verbatim;
+        # prepared statements let Postgres reuse their plans.
+        "prepare_threshold": (
+            settings.prepare_threshold if settings.prepare_threshold >= 0 else None
+        ),
+    }
+
+
+def get_pool(dsn: str | None = None) -> ConnectionPool:
+    dsn = dsn or settings.database_dsn
+    pool = _POOLS.get(dsn)
+    if pool is not None:
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo=dsn,
+                min_size=settings.pool_min_size,
+                max_size=max(settings.pool_min_size, settings.pool_max_size),
+                kwargs=_connect_kwargs(),
+                configure=_configure_connection,
+                open=False,
+            )
+            try:
+                pool.open(wait=True, timeout=settings.pool_open_timeout_s)
+            except PoolTimeout as e:
+                pool.close()
+                raise DatabaseError(
+                    f"Could not connect to the database within {settings.pool_open_timeout_s:g}s"
+                ) from e
+            _POOLS[dsn] = pool
+    return pool
+
+
+@atexit.register
+def close_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _connect(dsn: str) -> psycopg.Connection:
+    conn = psycopg.connect(dsn, **_connect_kwargs())
+    _configure_connection(conn)
+    return conn
+
+
 def run_select(
     sql: str,
     params: dict | None = None,
     preview: bool = True,
     statement_timeout_ms: int | None = None,
     dsn: str | None = None,
+    pooled: bool = True,
 ):
 
+    preview_limit = (
+        getattr(settings, "preview_limit", None)
+        or getattr(settings, "default_preview_limit", None)
+        or int(os.getenv("DEFAULT_PREVIEW_LIMIT", "200"))
+    )
+    # Push the row cap into the query so Postgres stops early instead of
+    # shipping the full result set; MAX_RETURNED_ROWS bounds non-preview calls.
+    max_rows = int(settings.max_returned_rows)
+    sql = ensure_limit(sql, min(int(preview_limit), max_rows) if preview else max_rows)
+
     try:
         dsn_value = dsn or settings.database_dsn
-        with connect(dsn_value, row_factory=dict_row) as conn:
+        # Both context managers commit on clean exit and roll back on error.
+        # One-shot callers (the CLI) pass pooled=False: a single connection
+        # instead of opening PG_POOL_MIN of them to answer one query.
+        conn_cm = get_pool(dsn_value).connection() if pooled else _connect(dsn_value)
+        with conn_cm as conn:
             with conn.cursor() as cur:
-                # statement timeout (override or default)
-                timeout = (
-                    statement_timeout_ms
+                # statement timeout: the pool sets the default per connection
+                timeout_override = (
+                    int(statement_timeout_ms)
                     if statement_timeout_ms is not None
-                    else settings.statement_timeout_ms
-                )
-
-                cur.execute(f"SET LOCAL statement_timeout = {int(timeout)};")
-                cur.execute(sql, params or {})
-
-                preview_limit = (
-                    getattr(settings, "preview_limit", None)
-                    or getattr(settings, "default_preview_limit", None)
-                    or int(os.getenv("DEFAULT_PREVIEW_LIMIT", "200"))
+                    and int(statement_timeout_ms) != settings.statement_timeout_ms
+                    else None
                 )
 
-                if preview:
-                    rows = cur.fetchmany(int(preview_limit))
-                else:
-                    rows = cur.fetchall()
+                # Pipeline mode sends SET LOCAL and the query in one round trip.
+                # It needs libpq >= 14 on the client; otherwise run them in sequence.
+                use_pipeline = timeout_override is not None and psycopg.Pipeline.is_supported()
+                with conn.pipeline() if use_pipeline else nullcontext():
+                    if timeout_override is not None:
+                        cur.execute(f"SET LOCAL statement_timeout = {timeout_override};")
+                    cur.execute(sql, params or {})
 
-                return rows
+                return cur.fetchall()
 
     except Exception as e:
         raise DatabaseError(str(e)) from e
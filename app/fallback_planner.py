@@ -2,10 +2,85 @@ from __future__ import annotations
 
 import re
 from datetime import date, timedelta
+from typing import Callable, FrozenSet, Optional, Tuple
 from app.query_plan import QueryPlan, DateRange, Dimension
 
-def fallback_plan(question: str, restaurant: str) -> QueryPlan:
+
+_TOP_N_RE = re.compile(r"\btop\s+(\d+)")
+_WORD_RE = re.compile(r"\w+")
+
+# English and Spanish forms; whole words only (see _ROUTES).
+_PRODUCT_KW = frozenset({"product", "products", "producto", "productos"})
+_PAYMENT_KW = frozenset({"payment", "payments", "pago", "pagos"})
+_METHOD_KW = frozenset({"method", "methods", "método", "métodos", "metodo", "metodos"})
+_EXPENSE_KW = frozenset({"expense", "expenses", "gasto", "gastos"})
+_CATEGORY_KW = frozenset({"category", "categories", "categoría", "categorías", "categoria", "categorias"})
+_COVERS_KW = frozenset({"covers", "guests", "comensales"})
+
+# Time-window rules: (pattern, days-from-match). Ordered by precedence: the
+# first pattern found anywhere in the question wins.
+_TIME_RULES: Tuple[Tuple[re.Pattern, Callable[[re.Match], int]], ...] = (
+    (re.compile("last month"), lambda m: 30),
+    (re.compile("last week"), lambda m: 7),
+    (re.compile(r"last\s+(\d+)\s+days"), lambda m: int(m.group(1))),
+)
+
+_BY_TIME_HINTS = ("by day", "per day", "daily", "by week", "by month")
+
+
+def _route_top_products(plan: QueryPlan, q: str) -> None:
+    plan.metric = "item_revenue"
+    plan.base_table = "items"
+    plan.dimensions = [Dimension(table="products", column="name", alias="product")]
+
+    # For ranking, aggregate over whole period unless explicitly asked
+    if not any(k in q for k in _BY_TIME_HINTS):
+        plan.time_grain = "none"
+
+    m = _TOP_N_RE.search(q)
+    plan.limit = int(m.group(1)) if m else 10
+
+
+def _route_payment_methods(plan: QueryPlan, q: str) -> None:
+    plan.metric = "payment_total"
+    plan.base_table = "payments"
+    plan.dimensions = [Dimension(table="payment_methods", column="name", alias="payment_method")]
+    plan.limit = None
+
+
+def _route_expense_categories(plan: QueryPlan, q: str) -> None:
+    plan.metric = "expense_total"
+    plan.base_table = "expenses"
+    plan.dimensions = [Dimension(table="expense_categories", column="name", alias="expense_category")]
+    plan.limit = None
+
+
+def _route_covers(plan: QueryPlan, q: str) -> None:
+    plan.metric = "covers"
+    plan.base_table = "sales"
+
+
+# (predicate, mutator) pairs applied in order; later matches override earlier ones.
+# Predicates test the question's word set, so "laptop" doesn't count as "top".
+_ROUTES: Tuple[Tuple[Callable[[FrozenSet[str]], bool], Callable[[QueryPlan, str], None]], ...] = (
+    (lambda w: "top" in w and not _PRODUCT_KW.isdisjoint(w), _route_top_products),
+    (lambda w: not _PAYMENT_KW.isdisjoint(w) and not _METHOD_KW.isdisjoint(w), _route_payment_methods),
+    (lambda w: not _EXPENSE_KW.isdisjoint(w) and not _CATEGORY_KW.isdisjoint(w), _route_expense_categories),
+    (lambda w: not _COVERS_KW.isdisjoint(w), _route_covers),
+)
+
+
+def _lookback_days(q: str) -> Optional[int]:
+    for pattern, days in _TIME_RULES:
+        m = pattern.search(q)
+        if m:
+            return days(m)
+    return None
+
+
+def fallback_plan(question: str, restaurant: str, today: Optional[date] = None) -> QueryPlan:
     q = question.lower().strip()
+    today = today or date.today()
 
     # Defaults
     plan = QueryPlan(
@@ -19,53 +94,16 @@ def fallback_plan(question: str, restaurant: str) -> QueryPlan:
     )
 
     # Time phrases (very basic)
-    m = re.search(r"last\s+(\d+)\s+days", q)
-    if m:
-        days = int(m.group(1))
-        end = date.today()
-        start = end - timedelta(days=days)
-        plan.date_range = DateRange(start=str(start), end=str(end))
-        plan.time_grain = "day"
-
-    if "last week" in q:
-        end = date.today()
-        start = end - timedelta(days=7)
-        plan.date_range = DateRange(start=str(start), end=str(end))
-        plan.time_grain = "day"
-
-    if "last month" in q:
-        end = date.today()
-        start = end - timedelta(days=30)
-        plan.date_range = DateRange(start=str(start), end=str(end))
+    days = _lookback_days(q)
+    if days is not None:
+        start = today - timedelta(days=days)
+        plan.date_range = DateRange(start=start.isoformat(), end=today.isoformat())
         plan.time_grain = "day"
 
     # Routing
-    if "top" in q and ("product" in q or "products" in q):
-        plan.metric = "item_revenue"
-        plan.base_table = "items"
-        plan.dimensions = [Dimension(table="products", column="name", alias="product")]
-
-        # For ranking, aggregate over whole period unless explicitly asked
-        if not any(k in q for k in ["by day", "per day", "daily", "by week", "by month"]):
-            plan.time_grain = "none"
-
-        m2 = re.search(r"top\s+(\d+)", q)
-        plan.limit = int(m2.group(1)) if m2 else 10
-
-    if "payment" in q and ("method" in q or "methods" in q):
-        plan.metric = "payment_total"
-        plan.base_table = "payments"
-        plan.dimensions = [Dimension(table="payment_methods", column="name", alias="payment_method")]
-        plan.limit = None
-
-    if "expense" in q and ("category" in q or "categories" in q):
-        plan.metric = "expense_total"
-        plan.base_table = "expenses"
-        plan.dimensions = [Dimension(table="expense_categories", column="name", alias="expense_category")]
-        plan.limit = None
-
-    if "covers" in q or "guests" in q:
-        plan.metric = "covers"
-        plan.base_table = "sales"
+    words = frozenset(_WORD_RE.findall(q))
+    for matches, route in _ROUTES:
+        if matches(words):
+            route(plan, q)
 
     return plan
@@ -1,10 +1,8 @@
 from __future__ import annotations
 
 from typing import Dict, List, Any
-import psycopg
-from psycopg.rows import dict_row
 
-from app.config import settings
+from app.db import get_pool
 from app.schema_pack import SCHEMA
 
 
@@ -14,25 +12,28 @@ def introspect_tables(schema: str = "public") -> Dict[str, Any]:
     """
     expected_tables = list(SCHEMA.tables.keys())
 
-    with psycopg.connect(settings.database_dsn, row_factory=dict_row) as conn:
+    # Let Postgres bucket columns per table: one row per table, one round trip.
+    with get_pool().connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT table_name, column_name, data_type
+                SELECT
+                    table_name,
+                    json_agg(
+                        json_build_object('column', column_name, 'type', data_type)
+                        ORDER BY ordinal_position
+                    ) AS cols
                 FROM information_schema.columns
                 WHERE table_schema = %s
                   AND table_name = ANY(%s)
-                ORDER BY table_name, ordinal_position
+                GROUP BY table_name
+                ORDER BY table_name
                 """,
                 (schema, expected_tables),
             )
-            rows = cur.fetchall()
-
-    by_table: Dict[str, List[Dict[str, Any]]] = {}
-    for r in rows:
-        by_table.setdefault(r["table_name"], []).append(
-            {"column": r["column_name"], "type": r["data_type"]}
-        )
+            by_table: Dict[str, List[Dict[str, Any]]] = {
+                r["table_name"]: r["cols"] for r in cur.fetchall()
+            }
 
     missing_tables = [t for t in expected_tables if t not in by_table]
 
@@ -1,35 +1,78 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
 import os
 import re
-from typing import Literal, Optional, Set, Any
-
-from openai import OpenAI
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field, replace
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
+
+import httpx
+import orjson
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from pydantic import BaseModel, ValidationError
 import sqlglot
 from sqlglot import expressions as exp
 
+from app import metrics, semantic_cache
 from app.schema_context import schema_prompt
 from app.sql_safety import validate_select_only, UnsafeSQL
 
 
-class LLMQuery(BaseModel):
+logger = logging.getLogger(__name__)
+
+
+ExpectedResult = Literal["scalar", "time_series", "breakdown", "table"]
+
+
+class LLMQueryIn(BaseModel):
+    """Validates the LLM's JSON payload; internally we use LLMQuery."""
+
     sql: str
-    expected_result: Optional[Literal["scalar", "time_series", "breakdown", "table"]] = "table"
+    expected_result: Optional[ExpectedResult] = "table"
     notes: Optional[str] = None
 
 
-def _extract_tables(sql: str) -> Set[str]:
-    try:
-        tree = _parse_sql(sql)
-    except Exception:
-        return set()
-    tables = set()
-    for t in tree.find_all(exp.Table):
-        if t.name:
-            tables.add(t.name)
-    return tables
+@dataclass(frozen=True, slots=True)
+class LLMQuery:
+    # frozen: results are shared through the question_to_sql cache
+    sql: str
+    expected_result: Optional[ExpectedResult] = "table"
+    notes: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        # flat fields only; cheaper than dataclasses.asdict's recursive deepcopy
+        return {"sql": self.sql, "expected_result": self.expected_result, "notes": self.notes}
+
+
+@dataclass
+class _TreeIndex:
+    """Nodes the post-LLM rewrites look at, collected in a single walk."""
+
+    tables: Set[str] = field(default_factory=set)
+    columns: Dict[str, List[exp.Column]] = field(default_factory=lambda: defaultdict(list))
+    eqs: List[exp.EQ] = field(default_factory=list)
+    selects: List[exp.Select] = field(default_factory=list)
+
+
+def _index_tree(tree: exp.Expression) -> _TreeIndex:
+    idx = _TreeIndex()
+    for node in tree.walk():
+        if isinstance(node, exp.Column):
+            idx.columns[node.name].append(node)
+        elif isinstance(node, exp.EQ):
+            idx.eqs.append(node)
+        elif isinstance(node, exp.Select):
+            idx.selects.append(node)
+        elif isinstance(node, exp.Table):
+            if node.name:
+                idx.tables.add(node.name)
+    return idx
 
 
 _PARAM_RE = re.compile(r"%\([a-zA-Z_][a-zA-Z0-9_]*\)s")
@@ -37,6 +80,8 @@ _PARAM_TOKEN = "__PARAM__TOKEN__"
 
 
 def _sanitize_params(sql: str) -> str:
+    if "%(" not in sql:
+        return sql
     return _PARAM_RE.sub(f"'{_PARAM_TOKEN}'", sql)
 
 
@@ -44,29 +89,50 @@ def _restore_params(sql: str) -> str:
     return sql.replace(f"'{_PARAM_TOKEN}'", "%(restaurant)s")
 
 
-def _parse_sql(sql: str) -> exp.Expression:
+@lru_cache(maxsize=256)
+def _parse_sql_cached(sql: str) -> exp.Expression:
     return sqlglot.parse_one(_sanitize_params(sql), read="postgres")
 
 
+def _parse_sql(sql: str) -> exp.Expression:
+    # Callers mutate the tree, so hand out a copy of the cached parse.
+    return _parse_sql_cached(sql).copy()
+
+
 def _strip_code_fence(text: str) -> str:
     # Remove ```json / ```sql fences if present
-    if text.strip().startswith("```"):
-        lines = text.strip().splitlines()
-        if len(lines) >= 2 and lines[0].startswith("```"):
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.splitlines()
+        if len(lines) >= 2:
             # drop first and last fence line
             return "\n".join(lines[1:-1]).strip()
-    return text.strip()
+    return text
+
+
+def _as_json_object(data: Any) -> Optional[dict]:
+    if isinstance(data, dict):
+        return data
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return data[0]
+    return None
 
 
 def _extract_json_object(text: str) -> Optional[dict]:
+    # Fast path: the model usually returns bare JSON, so skip the fence handling.
+    try:
+        data = _as_json_object(orjson.loads(text))
+        if data is not None:
+            return data
+    except orjson.JSONDecodeError:
+        pass
+
     text = _strip_code_fence(text)
     try:
-        data = json.loads(text)
-        if isinstance(data, dict):
+        data = _as_json_object(orjson.loads(text))
+        if data is not None:
             return data
-        if isinstance(data, list) and data and isinstance(data[0], dict):
-            return data[0]
-    except Exception:
+    except orjson.JSONDecodeError:
         pass
 
     # try to find the first {...} block
@@ -75,18 +141,24 @@ def _extract_json_object(text: str) -> Optional[dict]:
     if start != -1 and end != -1 and end > start:
         snippet = text[start : end + 1]
         try:
-            data = json.loads(snippet)
+            data = orjson.loads(snippet)
             if isinstance(data, dict):
                 return data
-        except Exception:
+        except orjson.JSONDecodeError:
             return None
     return None
 
 
+_SELECT_RE = re.compile(r"(WITH\s+.+?SELECT\s+|SELECT\s+)", re.IGNORECASE | re.DOTALL)
+_SALES_RE = re.compile(r"\bsales\b", re.IGNORECASE)
+_SALE_STATE_RE = re.compile(r"sale_state", re.IGNORECASE)
+_CLOSED_RE = re.compile(r"'closed'", re.IGNORECASE)
+
+
 def _extract_sql(text: str) -> Optional[str]:
     text = _strip_code_fence(text)
     # try to find a SELECT or WITH statement
-    m = re.search(r"(WITH\\s+.+?SELECT\\s+|SELECT\\s+)", text, flags=re.IGNORECASE | re.DOTALL)
+    m = _SELECT_RE.search(text)
     if not m:
         return None
     sql = text[m.start():].strip()
@@ -94,13 +166,11 @@ def _extract_sql(text: str) -> Optional[str]:
 
 
 def _requires_sales_filter(sql: str) -> bool:
-    s = sql.lower()
-    return " sales " in f" {s} " or "sales." in s
+    return _SALES_RE.search(sql) is not None
 
 
 def _has_closed_filter(sql: str) -> bool:
-    s = sql.lower().replace('"', "")
-    return "sale_state" in s and "'closed'" in s
+    return _SALE_STATE_RE.search(sql) is not None and _CLOSED_RE.search(sql) is not None
 
 
 def _has_restaurant_param(sql: str) -> bool:
@@ -108,35 +178,35 @@ def _has_restaurant_param(sql: str) -> bool:
 
 
 def _split_and(expr: exp.Expression) -> list[exp.Expression]:
+    # Iterative (left-to-right) so long AND chains don't recurse per level.
     parts: list[exp.Expression] = []
-    if isinstance(expr, exp.And):
-        parts.extend(_split_and(expr.left))
-        parts.extend(_split_and(expr.right))
-    else:
-        parts.append(expr)
+    stack = [expr]
+    And = exp.And
+    while stack:
+        e = stack.pop()
+        if isinstance(e, And):
+            stack.append(e.right)
+            stack.append(e.left)
+        else:
+            parts.append(e)
     return parts
 
 
 def _mentions_column(expr: exp.Expression, table: str, column: str) -> bool:
-    for c in expr.find_all(exp.Column):
-        if c.name == column and (c.table == table or c.table is None and table is None):
+    Column = exp.Column
+    for c in expr.walk():
+        if isinstance(c, Column) and c.name == column and (c.table == table or c.table is None and table is None):
             return True
     return False
 
 
-def _replace_column(tree: exp.Expression, table: str, old: str, new: str) -> exp.Expression:
-    for col in tree.find_all(exp.Column):
-        if col.name == old and col.table == table:
+def _replace_column(idx: _TreeIndex, table: str, old: str, new: str) -> None:
+    for col in idx.columns.get(old, ()):
+        if col.table == table:
             col.set("this", exp.Identifier(this=new))
-    return tree
-
 
-def _apply_last_completed_week(sql: str, table: str, column: str) -> str:
-    try:
-        tree = _parse_sql(sql)
-    except Exception:
-        return sql
 
+def _apply_last_completed_week(tree: exp.Expression, table: str, column: str) -> exp.Expression:
     where = tree.args.get("where")
     new_pred = exp.and_(
         exp.GTE(
@@ -154,7 +224,7 @@ def _apply_last_completed_week(sql: str, table: str, column: str) -> str:
 
     if where is None:
         tree.set("where", exp.Where(this=new_pred))
-        return _restore_params(tree.sql(dialect="postgres"))
+        return tree
 
     parts = _split_and(where.this)
     filtered = [
@@ -166,178 +236,676 @@ def _apply_last_completed_week(sql: str, table: str, column: str) -> str:
     for p in filtered[1:]:
         combined = exp.and_(combined, p)
     tree.set("where", exp.Where(this=combined))
-    return _restore_params(tree.sql(dialect="postgres"))
+    return tree
+
+
+def _items_revenue_expr() -> exp.Expression:
+    return exp.Sum(
+        this=exp.Mul(
+            this=exp.Column(this=exp.Identifier(this="price"), table=exp.Identifier(this="items")),
+            expression=exp.Column(this=exp.Identifier(this="quantity"), table=exp.Identifier(this="items")),
+        )
+    )
+
+
+def _apply_product_revenue(tree: exp.Expression, idx: _TreeIndex) -> bool:
+    """
+    If the query filters on products.name, rewrite it to item revenue
+    (items.price * items.quantity). Mutates tree; returns True if applied.
+    """
+    product_name_eqs = [eq for eq in idx.eqs if _mentions_column(eq, "products", "name")]
+    if not product_name_eqs:
+        return False
+
+    # Build new nodes before mutating anything so a failure leaves the tree intact.
+    # IS NOT TRUE: sqlglot models it as NOT (x IS TRUE)
+    canceled_pred = exp.Not(
+        this=exp.Is(
+            this=exp.Column(this=exp.Identifier(this="canceled"), table=exp.Identifier(this="items")),
+            expression=exp.Boolean(this=True),
+        )
+    )
+
+    # replace SUM(sales.total) with SUM(items.price * items.quantity)
+    for s in idx.selects:
+        for i, sel in enumerate(s.expressions):
+            if isinstance(sel, exp.Alias):
+                target = sel.this
+                if isinstance(target, exp.Sum) and _mentions_column(target, "sales", "total"):
+                    s.expressions[i] = exp.Alias(this=_items_revenue_expr(), alias=sel.alias)
+            elif isinstance(sel, exp.Sum) and _mentions_column(sel, "sales", "total"):
+                s.expressions[i] = _items_revenue_expr()
+
+    # make product name match case-insensitive if using equality
+    for eq in product_name_eqs:
+        eq.replace(
+            exp.ILike(
+                this=eq.this,
+                expression=eq.expression,
+            )
+        )
+
+    # coalesce sum to 0 for product revenue
+    for s in idx.selects:
+        for i, sel in enumerate(s.expressions):
+            if isinstance(sel, exp.Alias):
+                target = sel.this
+                if isinstance(target, exp.Sum):
+                    s.expressions[i] = exp.Alias(
+                        this=exp.Coalesce(this=target, expressions=[exp.Literal.number(0)]),
+                        alias=sel.alias,
+                    )
+            elif isinstance(sel, exp.Sum):
+                s.expressions[i] = exp.Coalesce(this=sel, expressions=[exp.Literal.number(0)])
+
+    # ensure items.canceled IS NOT TRUE
+    # (last: and_() copies its operands, which would detach nodes held in idx)
+    where = tree.args.get("where")
+    if where is None:
+        tree.set("where", exp.Where(this=canceled_pred))
+    else:
+        parts = _split_and(where.this)
+        if not any(_mentions_column(p, "items", "canceled") for p in parts):
+            parts.append(canceled_pred)
+            combined = parts[0]
+            for p in parts[1:]:
+                combined = exp.and_(combined, p)
+            tree.set("where", exp.Where(this=combined))
+
+    return True
+
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_SELECT_KW_RE = re.compile(r"\bselect\b", re.IGNORECASE)
+_ITEMS_JOIN_RE = re.compile(r"\bjoin\s+items\b", re.IGNORECASE)
+_SUM_RE = re.compile(r"\bsum\s*\(", re.IGNORECASE)
+_SUM_SALES_TOTAL_RE = re.compile(r"\bsum\s*\(\s*sales\.total\s*\)", re.IGNORECASE)
+_WHERE_RE = re.compile(r"\bwhere\b", re.IGNORECASE)
+_WHERE_END_RE = re.compile(r"\b(?:group\s+by|having|order\s+by|window|limit|offset)\b", re.IGNORECASE)
+_PRODUCT_NAME_EQ_RE = re.compile(r"\bproducts\.name\s*=\s*", re.IGNORECASE)
+_PRODUCT_NAME_RHS_RE = re.compile(r"=\s*products\.name\b", re.IGNORECASE)
+_ITEMS_CANCELED_RE = re.compile(r"\bitems\.canceled\b", re.IGNORECASE)
+
+
+def _mask_literals(sql: str) -> str:
+    # Same length as sql, with string literal contents blanked so keyword
+    # searches can't match inside e.g. products.name = 'No Limit Burger'.
+    return _STRING_LITERAL_RE.sub(lambda m: "'" + "_" * (len(m.group()) - 2) + "'", sql)
+
+
+def _apply_product_revenue_fast(sql: str) -> Optional[str]:
+    """
+    String-level equivalent of _apply_product_revenue for the common shape:
+    one SELECT joining items, a single SUM(sales.total) before WHERE, and
+    products.name equality only inside the WHERE clause. Returns None when
+    the shape doesn't match, so the caller falls back to sqlglot.
+    """
+    sql = sql.strip().rstrip(";").rstrip()
+    masked = _mask_literals(sql)
+
+    if len(_SELECT_KW_RE.findall(masked)) != 1 or not _ITEMS_JOIN_RE.search(masked):
+        return None
+    if _PRODUCT_NAME_RHS_RE.search(masked):
+        return None
+
+    wheres = list(_WHERE_RE.finditer(masked))
+    if len(wheres) != 1:
+        return None
+    where_start = wheres[0].end()
+    end_m = _WHERE_END_RE.search(masked, where_start)
+    where_end = end_m.start() if end_m else len(sql)
+
+    sums = _SUM_RE.findall(masked)
+    sum_total = _SUM_SALES_TOTAL_RE.search(masked)
+    if len(sums) != 1 or sum_total is None or sum_total.end() > where_start:
+        return None
+
+    eqs = list(_PRODUCT_NAME_EQ_RE.finditer(masked))
+    if not eqs or any(m.start() < where_start or m.end() > where_end for m in eqs):
+        return None
+
+    # WHERE body: equality -> ILIKE, then AND the canceled filter unless present
+    body = sql[where_start:where_end]
+    for m in reversed(eqs):
+        s, e = m.start() - where_start, m.end() - where_start
+        body = body[:s] + "products.name ILIKE " + body[e:]
+    trailing = body[len(body.rstrip()):] or " "
+    body = body.strip()
+    if not _ITEMS_CANCELED_RE.search(masked, where_start, where_end):
+        body = f"({body}) AND items.canceled IS NOT TRUE"
+
+    head = (
+        sql[: sum_total.start()]
+        + "COALESCE(SUM(items.price * items.quantity), 0)"
+        + sql[sum_total.end() : where_start]
+    )
+    tail = sql[where_end:]
+    rewritten = f"{head} {body}{trailing}{tail}".rstrip()
+
+    try:
+        validate_select_only(rewritten)
+    except UnsafeSQL:
+        return None
+    return rewritten
+
+
+# The SDK defaults allow a 10 minute read timeout and drop idle keep-alive
+# connections after 5s; a planner call is a few seconds, and /ask traffic is
+# bursty, so fail faster and keep warm connections around longer.
+_OPENAI_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0)
+_OPENAI_TIMEOUT = httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_S", "30")), connect=5.0)
+
+
+@lru_cache(maxsize=1)
+def _client() -> OpenAI:
+    return OpenAI(timeout=_OPENAI_TIMEOUT, http_client=DefaultHttpxClient(limits=_OPENAI_LIMITS))
+
+
+@lru_cache(maxsize=1)
+def _async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(timeout=_OPENAI_TIMEOUT, http_client=DefaultAsyncHttpxClient(limits=_OPENAI_LIMITS))
+
+
+# Caps in-flight OpenAI calls from the async path so a burst of /ask requests
+# doesn't blow through the account's RPM limit. The SDK itself retries
+# RateLimitError with exponential backoff.
+_LLM_SLOTS = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")))
+
+
+def _normalize_question(question: str) -> str:
+    # Case/whitespace variants of the same question share one cache entry.
+    return " ".join(question.split()).lower()
+
+
+# Identical questions skip the LLM round trip. Failures raise and are not cached.
+# Shared by the sync and async entry points, hence a plain LRU dict instead of
+# functools.lru_cache. Values are (expires_at monotonic, plan).
+_PLAN_CACHE: "OrderedDict[Tuple[str, str, str], Tuple[float, LLMQuery]]" = OrderedDict()
+_PLAN_CACHE_MAX = 4096
+_PLAN_CACHE_TTL_S = float(os.getenv("PLAN_CACHE_TTL_S", str(7 * 24 * 3600)))
+_PLAN_CACHE_LOCK = threading.Lock()
+
+_RELATIVE_TIME_RE = re.compile(
+    r"\b(?:today|tonight|yesterday|this|last|past|previous|current|recent|ytd|mtd|"
+    r"hoy|ayer|este|esta|pasado|pasada|anterior|actual)\b",
+    re.IGNORECASE,  # the semantic tier passes the raw question, not the cache key
+)
+_DATE_LITERAL_RE = re.compile(r"'\d{4}-\d{2}-\d{2}")
+
+
+def _plan_ttl(question: str, plan: LLMQuery) -> float:
+    """
+    Seconds a cached plan stays valid. Relative questions normally become
+    now()/CURRENT_DATE arithmetic and never go stale, but if the model baked a
+    literal date into one, that answer is only good until the next UTC midnight.
+    """
+    if _DATE_LITERAL_RE.search(plan.sql) and _RELATIVE_TIME_RE.search(question):
+        now = datetime.now(timezone.utc)
+        midnight = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        return min((midnight - now).total_seconds(), _PLAN_CACHE_TTL_S)
+    return _PLAN_CACHE_TTL_S
+
+
+def _cache_key(question: str, restaurant: str) -> Tuple[str, str, str]:
+    return (_normalize_question(question), restaurant, os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+
+
+def _cache_get(key: Tuple[str, str, str]) -> Optional[LLMQuery]:
+    with _PLAN_CACHE_LOCK:
+        entry = _PLAN_CACHE.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= monotonic():
+            del _PLAN_CACHE[key]
+            return None
+        _PLAN_CACHE.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(key: Tuple[str, str, str], plan: LLMQuery) -> None:
+    expires_at = monotonic() + _plan_ttl(key[0], plan)
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE[key] = (expires_at, plan)
+        _PLAN_CACHE.move_to_end(key)
+        if len(_PLAN_CACHE) > _PLAN_CACHE_MAX:
+            _PLAN_CACHE.popitem(last=False)
 
 
 def question_to_sql(question: str, restaurant: str) -> LLMQuery:
-    client = OpenAI()
-    system_prompt = schema_prompt()
+    start = perf_counter()
+    key = _cache_key(question, restaurant)
+    plan = _cache_get(key)
+    metrics.cache_result("exact", hit=plan is not None)
+    if plan is None:
+        # the normalized text is only the cache key; the model sees the user's wording
+        plan = _resolve_sql(question, restaurant, key[2])
+        _cache_put(key, plan)
+    else:
+        metrics.observe_plan("exact", perf_counter() - start)
+    return plan
+
+
+# Singleflight for the async path: concurrent identical questions that miss
+# the cache wait on the first caller's OpenAI call instead of issuing their own.
+_INFLIGHT: Dict[Tuple[str, str, str], "asyncio.Future[LLMQuery]"] = {}
+
+
+async def question_to_sql_async(question: str, restaurant: str) -> LLMQuery:
+    """Same as question_to_sql, but the OpenAI calls don't block the event loop."""
+    start = perf_counter()
+    key = _cache_key(question, restaurant)
+    plan = _cache_get(key)
+    metrics.cache_result("exact", hit=plan is not None)
+    if plan is not None:
+        metrics.observe_plan("exact", perf_counter() - start)
+        return plan
+
+    pending = _INFLIGHT.get(key)
+    if pending is not None:
+        try:
+            plan = await asyncio.shield(pending)
+            metrics.observe_plan("inflight", perf_counter() - start)
+            return plan
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # the leading request was cancelled; do the work ourselves
+
+    fut: "asyncio.Future[LLMQuery]" = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = fut
+    try:
+        plan = await _resolve_sql_async(question, restaurant, key[2])
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # waiters re-raise it; don't warn when there are none
+        raise
+    finally:
+        if _INFLIGHT.get(key) is fut:
+            del _INFLIGHT[key]
+    _cache_put(key, plan)
+    fut.set_result(plan)
+    return plan
+
+
+def invalidate_question_cache() -> None:
+    """Drop cached question -> SQL results (e.g. after a schema/prompt change)."""
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE.clear()
+    semantic_cache.clear()
+
+
+def _semantic_scope(question: str, restaurant: str, model: str) -> Tuple[Any, ...]:
+    # Paraphrases ("sales past 7 days" / "revenue last 7 days") reuse a prior
+    # answer, but only when their numbers, time words, metric terms and
+    # grouping match exactly.
+    return (restaurant, model, semantic_cache.guard_signature(question))
+
+
+def _semantic_hit(plan: LLMQuery) -> LLMQuery:
+    return replace(plan, notes=(plan.notes or "") + " | cache:semantic")
+
+
+def _record_resolve(start: float, semantic_hit: Optional[bool]) -> None:
+    # semantic_hit is None when the semantic tier wasn't consulted
+    if semantic_hit is not None:
+        metrics.cache_result("semantic", hit=semantic_hit)
+    metrics.observe_plan("semantic" if semantic_hit else "llm", perf_counter() - start)
+
+
+def _resolve_sql(question: str, restaurant: str, model: str) -> LLMQuery:
+    start = perf_counter()
+    if not semantic_cache.enabled():
+        plan = _generate_sql(question, restaurant, model)
+        _record_resolve(start, None)
+        return plan
+    vector = semantic_cache.embed(_client(), question)
+    if vector is None:
+        plan = _generate_sql(question, restaurant, model)
+        _record_resolve(start, None)
+        return plan
+    scope = _semantic_scope(question, restaurant, model)
+    hit = semantic_cache.lookup(vector, scope)
+    if hit is not None:
+        _record_resolve(start, True)
+        return _semantic_hit(hit)
+    plan = _generate_sql(question, restaurant, model)
+    semantic_cache.store(vector, scope, plan, ttl=_plan_ttl(question, plan))
+    _record_resolve(start, False)
+    return plan
+
+
+async def _resolve_sql_async(question: str, restaurant: str, model: str) -> LLMQuery:
+    start = perf_counter()
+    if not semantic_cache.enabled():
+        plan = await _generate_sql_async(question, restaurant, model)
+        _record_resolve(start, None)
+        return plan
+    vector = await semantic_cache.embed_async(_async_client(), question)
+    if vector is None:
+        plan = await _generate_sql_async(question, restaurant, model)
+        _record_resolve(start, None)
+        return plan
+    scope = _semantic_scope(question, restaurant, model)
+    hit = semantic_cache.lookup(vector, scope)
+    if hit is not None:
+        _record_resolve(start, True)
+        return _semantic_hit(hit)
+    plan = await _generate_sql_async(question, restaurant, model)
+    semantic_cache.store(vector, scope, plan, ttl=_plan_ttl(question, plan))
+    _record_resolve(start, False)
+    return plan
+
+
+# Structured outputs: the API guarantees a reply matching this schema, so
+# the free-text/fenced-JSON recovery below only matters for models that
+# don't support it.
+_ANSWER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "sql": {"type": "string"},
+        "expected_result": {"type": "string", "enum": ["scalar", "time_series", "breakdown", "table"]},
+        "notes": {"type": ["string", "null"]},
+    },
+    "required": ["sql", "expected_result", "notes"],
+    "additionalProperties": False,
+}
+_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "llm_query", "schema": _ANSWER_SCHEMA, "strict": True},
+}
+_BATCH_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "llm_query_batch",
+        "schema": {
+            "type": "object",
+            "properties": {"answers": {"type": "array", "items": _ANSWER_SCHEMA}},
+            "required": ["answers"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+}
+
+
+def _log_usage(resp: Any) -> None:
+    # OpenAI caches prompt prefixes of 1024+ tokens automatically; the schema
+    # prompt is the shared prefix, so cached_tokens should track it on warm calls.
+    usage = getattr(resp, "usage", None)
+    if usage is None or not logger.isEnabledFor(logging.DEBUG):
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    logger.debug("openai usage: prompt_tokens=%s cached_tokens=%s", usage.prompt_tokens, cached)
+
+
+def _sql_messages(question: str) -> List[Dict[str, str]]:
+    # The system message must stay byte-identical across requests (no
+    # question, date or restaurant in it) so the provider's prefix cache hits.
     user_prompt = (
         "Generate SQL to answer the user question.\n"
         "Return JSON only. Use %(restaurant)s as the restaurant param.\n"
         f"Question: {question}\n"
     )
+    return [
+        {"role": "system", "content": schema_prompt()},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    resp = client.chat.completions.create(
+
+def _generate_sql(question: str, restaurant: str, model: str) -> LLMQuery:
+    resp = _client().chat.completions.create(
         model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=_sql_messages(question),
         temperature=0.0,
+        response_format=_RESPONSE_FORMAT,
     )
+    _log_usage(resp)
+    return _plan_from_content(question, resp.choices[0].message.content or "")
 
-    content = resp.choices[0].message.content or ""
 
-    data = _extract_json_object(content)
-    if data is None:
-        sql = _extract_sql(content)
-        if not sql:
-            snippet = content.strip().replace("\n", " ")[:200]
-            raise ValueError(f"LLM response was not JSON or SQL. Snippet: {snippet}")
-        plan = LLMQuery(sql=sql, expected_result="table", notes="extracted_sql")
+async def _generate_sql_async(question: str, restaurant: str, model: str) -> LLMQuery:
+    if _BATCH_WINDOW_S > 0:
+        content = await _enqueue_batched(question, restaurant, model)
     else:
-        # normalize common alternate key names
-        if "sql" not in data:
-            if "query" in data:
-                data["sql"] = data["query"]
-            elif "sql_query" in data:
-                data["sql"] = data["sql_query"]
-
-        # normalize expected_result if malformed
-        if "expected_result" in data:
-            if not isinstance(data["expected_result"], str):
-                data["expected_result"] = "table"
-            else:
-                allowed = {"scalar", "time_series", "breakdown", "table"}
-                if data["expected_result"] not in allowed:
-                    data["expected_result"] = "table"
+        content = await _complete_one(question, model)
+    return _plan_from_content(question, content)
 
+
+async def _complete_one(question: str, model: str) -> str:
+    async with _LLM_SLOTS:
+        resp = await _async_client().chat.completions.create(
+            model=model,
+            messages=_sql_messages(question),
+            temperature=0.0,
+            response_format=_RESPONSE_FORMAT,
+        )
+    _log_usage(resp)
+    return resp.choices[0].message.content or ""
+
+
+# Optional micro-batching for the async path: questions arriving within
+# OPENAI_BATCH_WINDOW_MS of each other share one chat completion (same system
+# prompt, numbered questions, JSON array back). Off by default; a malformed
+# batch reply falls back to one call per question. Only questions for the same
+# restaurant and model share a completion, so one caller's text can't steer
+# the SQL generated for another tenant.
+_BATCH_WINDOW_S = int(os.getenv("OPENAI_BATCH_WINDOW_MS", "0")) / 1000.0
+_BATCH_MAX = 16
+_BatchItem = Tuple[str, str, str, asyncio.Future]
+_BATCHER: Optional[Tuple[asyncio.AbstractEventLoop, "asyncio.Queue[_BatchItem]"]] = None
+# The event loop only keeps weak references to tasks; hold them until done.
+_BATCH_TASKS: Set["asyncio.Task[None]"] = set()
+
+
+def _spawn(coro: Any) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _BATCH_TASKS.add(task)
+    task.add_done_callback(_BATCH_TASKS.discard)
+
+
+async def _enqueue_batched(question: str, restaurant: str, model: str) -> str:
+    global _BATCHER
+    loop = asyncio.get_running_loop()
+    if _BATCHER is None or _BATCHER[0] is not loop:
+        queue: "asyncio.Queue[_BatchItem]" = asyncio.Queue()
+        _spawn(_planner_batcher(queue))
+        _BATCHER = (loop, queue)
+    fut = loop.create_future()
+    _BATCHER[1].put_nowait((question, restaurant, model, fut))
+    return await fut
+
+
+async def _planner_batcher(queue: "asyncio.Queue[_BatchItem]") -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + _BATCH_WINDOW_S
+        while len(batch) < _BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        by_scope: Dict[Tuple[str, str], List[Tuple[str, asyncio.Future]]] = defaultdict(list)
+        for question, restaurant, model, fut in batch:
+            by_scope[(restaurant, model)].append((question, fut))
+        for (_, model), items in by_scope.items():
+            _spawn(_run_batch(model, items))
+
+
+async def _run_batch(model: str, items: List[Tuple[str, asyncio.Future]]) -> None:
+    answers: Optional[List[str]] = None
+    if len(items) > 1:
         try:
-            plan = LLMQuery(**data)
-        except ValidationError as e:
-            snippet = content.strip().replace("\n", " ")[:200]
-            raise ValueError(f"LLM JSON failed validation: {e}. Snippet: {snippet}") from e
+            answers = await _complete_many([q for q, _ in items], model)
+        except Exception:
+            answers = None
+    if answers is None:
+        # single question, or the batch reply was unusable
+        results = await asyncio.gather(
+            *(_complete_one(q, model) for q, _ in items), return_exceptions=True
+        )
+    else:
+        results = answers
+    for (_, fut), result in zip(items, results):
+        if fut.done():
+            continue
+        if isinstance(result, BaseException):
+            fut.set_exception(result)
+        else:
+            fut.set_result(result)
+
+
+async def _complete_many(questions: List[str], model: str) -> Optional[List[str]]:
+    numbered = "\n".join(f"{i}) {q}" for i, q in enumerate(questions, 1))
+    user_prompt = (
+        f"Generate SQL to answer each of the following {len(questions)} user questions.\n"
+        "Return JSON only: an object with key \"answers\" holding an array with one entry "
+        "per question, in order, each being the JSON object you would return for that question alone. "
+        "Use %(restaurant)s as the restaurant param.\n"
+        f"Questions:\n{numbered}\n"
+    )
+    async with _LLM_SLOTS:
+        resp = await _async_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": schema_prompt()},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.0,
+            response_format=_BATCH_RESPONSE_FORMAT,
+        )
+    _log_usage(resp)
+    data = _extract_json_object(resp.choices[0].message.content or "")
+    answers = data.get("answers") if data else None
+    if not isinstance(answers, list) or len(answers) != len(questions):
+        return None
+    if not all(isinstance(a, dict) for a in answers):
+        return None
+    # each entry goes through the normal single-answer parsing/guards
+    return [orjson.dumps(a).decode() for a in answers]
 
-    # Basic SQL safety
-    validate_select_only(plan.sql)
+
+def _plan_from_content(question: str, content: str) -> LLMQuery:
+    # Well-formed structured-output replies validate straight from the raw
+    # JSON (parse + validate in one pydantic-core pass); anything else goes
+    # through the lenient recovery below.
+    try:
+        fast = LLMQueryIn.model_validate_json(content)
+    except ValidationError:
+        fast = None
+
+    if fast is not None:
+        plan = LLMQuery(sql=fast.sql, expected_result=fast.expected_result or "table", notes=fast.notes)
+    else:
+        data = _extract_json_object(content)
+        if data is None:
+            sql = _extract_sql(content)
+            if not sql:
+                snippet = content.strip().replace("\n", " ")[:200]
+                raise ValueError(f"LLM response was not JSON or SQL. Snippet: {snippet}")
+            plan = LLMQuery(sql=sql, expected_result="table", notes="extracted_sql")
+        else:
+            # normalize common alternate key names
+            if "sql" not in data:
+                if "query" in data:
+                    data["sql"] = data["query"]
+                elif "sql_query" in data:
+                    data["sql"] = data["sql_query"]
+
+            # normalize expected_result if malformed
+            if "expected_result" in data:
+                if not isinstance(data["expected_result"], str):
+                    data["expected_result"] = "table"
+                else:
+                    allowed = {"scalar", "time_series", "breakdown", "table"}
+                    if data["expected_result"] not in allowed:
+                        data["expected_result"] = "table"
+
+            try:
+                parsed = LLMQueryIn(**data)
+            except ValidationError as e:
+                snippet = content.strip().replace("\n", " ")[:200]
+                raise ValueError(f"LLM JSON failed validation: {e}. Snippet: {snippet}") from e
+            plan = LLMQuery(sql=parsed.sql, expected_result=parsed.expected_result, notes=parsed.notes)
+
+    # Basic SQL safety: cheap string checks first, so bad LLM output is
+    # rejected before paying for a sqlglot parse.
+    sql_lower = plan.sql.lower()
+    if "select" not in sql_lower:
+        raise UnsafeSQL("Only SELECT queries are allowed.")
     if not _has_restaurant_param(plan.sql):
         raise UnsafeSQL("SQL must include %(restaurant)s parameter for restaurant scoping.")
     if _requires_sales_filter(plan.sql) and not _has_closed_filter(plan.sql):
         raise UnsafeSQL("SQL must enforce sales.sale_state = 'CLOSED'.")
+    validate_select_only(plan.sql)
 
-    # Time window normalization for "last completed week" / "last week"
+    # AST normalizations: parse once, rewrite in place, serialize once.
+    # Cheap substring probes decide which rewrites can apply; when none can,
+    # the SQL is returned as-is without touching sqlglot.
     q = question.lower()
-    if "last completed week" in q or "last complete week" in q or "last full week" in q or "last week" in q:
-        tables = _extract_tables(plan.sql)
-        if "sales" in tables:
-            plan = LLMQuery(
-                sql=_apply_last_completed_week(plan.sql, "sales", "created_at"),
-                expected_result=plan.expected_result,
-                notes=(plan.notes or "") + " | normalized:last_week",
-            )
-        elif "payments" in tables and "sales" not in tables:
-            plan = LLMQuery(
-                sql=_apply_last_completed_week(plan.sql, "payments", "created_at"),
-                expected_result=plan.expected_result,
-                notes=(plan.notes or "") + " | normalized:last_week",
-            )
+    wants_last_week = (
+        ("last completed week" in q or "last complete week" in q or "last full week" in q or "last week" in q)
+        and ("sales" in sql_lower or "payments" in sql_lower)
+    )
+    wants_created_at = "closed_at" in sql_lower
+    wants_product_revenue = "products" in sql_lower and "name" in sql_lower
 
-    # Never use closed_at; replace with created_at when sales table is present
-    try:
-        tree = _parse_sql(plan.sql)
-        tree = _replace_column(tree, "sales", "closed_at", "created_at")
-        plan = LLMQuery(
-            sql=_restore_params(tree.sql(dialect="postgres")),
-            expected_result=plan.expected_result,
-            notes=(plan.notes or "") + " | normalized:created_at",
-        )
-    except Exception:
-        pass
+    # Product-revenue-only queries of the common shape skip sqlglot entirely.
+    if wants_product_revenue and not (wants_last_week or wants_created_at):
+        fast_sql = _apply_product_revenue_fast(plan.sql)
+        if fast_sql is not None:
+            return replace(plan, sql=fast_sql, notes=(plan.notes or "") + " | normalized:product_revenue(fast)")
 
-    # If query filters on products.name, ensure item revenue (items.price * items.quantity)
-    try:
-        tree = _parse_sql(plan.sql)
-        has_product_name = any(
-            isinstance(expr, exp.EQ)
-            and _mentions_column(expr, "products", "name")
-            for expr in tree.find_all(exp.EQ)
-        )
-        if has_product_name:
-            # replace SUM(sales.total) with SUM(items.price * items.quantity)
-            for s in tree.find_all(exp.Select):
-                for i, sel in enumerate(s.expressions):
-                    if isinstance(sel, exp.Alias):
-                        target = sel.this
-                        if isinstance(target, exp.Sum) and _mentions_column(target, "sales", "total"):
-                            new_expr = exp.Sum(
-                                this=exp.Mul(
-                                    this=exp.Column(this=exp.Identifier(this="price"), table=exp.Identifier(this="items")),
-                                    expression=exp.Column(this=exp.Identifier(this="quantity"), table=exp.Identifier(this="items")),
-                                )
-                            )
-                            s.expressions[i] = exp.Alias(this=new_expr, alias=sel.alias)
-                    elif isinstance(sel, exp.Sum) and _mentions_column(sel, "sales", "total"):
-                        s.expressions[i] = exp.Sum(
-                            this=exp.Mul(
-                                this=exp.Column(this=exp.Identifier(this="price"), table=exp.Identifier(this="items")),
-                                expression=exp.Column(this=exp.Identifier(this="quantity"), table=exp.Identifier(this="items")),
-                            )
-                        )
-
-            # ensure items.canceled IS NOT TRUE
-            where = tree.args.get("where")
-            canceled_pred = exp.IsNot(
-                this=exp.Column(this=exp.Identifier(this="canceled"), table=exp.Identifier(this="items")),
-                expression=exp.Boolean(this=True),
-            )
-            if where is None:
-                tree.set("where", exp.Where(this=canceled_pred))
-            else:
-                parts = _split_and(where.this)
-                if not any(_mentions_column(p, "items", "canceled") for p in parts):
-                    parts.append(canceled_pred)
-                    combined = parts[0]
-                    for p in parts[1:]:
-                        combined = exp.and_(combined, p)
-                    tree.set("where", exp.Where(this=combined))
-
-            # make product name match case-insensitive if using equality
-            for eq in tree.find_all(exp.EQ):
-                if _mentions_column(eq, "products", "name"):
-                    right = eq.expression
-                    left = eq.this
-                    eq.replace(
-                        exp.ILike(
-                            this=left,
-                            expression=right,
-                        )
-                    )
+    tree = None
+    if wants_last_week or wants_created_at or wants_product_revenue:
+        try:
+            tree = _parse_sql(plan.sql)
+        except Exception:
+            tree = None
+
+    if tree is not None:
+        notes = plan.notes or ""
+        idx = _index_tree(tree)
+
+        # Time window normalization for "last completed week" / "last week"
+        if wants_last_week:
+            week_table = None
+            if "sales" in idx.tables:
+                week_table = "sales"
+            elif "payments" in idx.tables:
+                week_table = "payments"
+            if week_table:
+                tree = _apply_last_completed_week(tree, week_table, "created_at")
+                notes += " | normalized:last_week"
+                # the WHERE clause was rebuilt; re-index so later rewrites see it
+                idx = _index_tree(tree)
+
+        # Never use closed_at; replace with created_at when sales table is present
+        if wants_created_at:
+            _replace_column(idx, "sales", "closed_at", "created_at")
+            notes += " | normalized:created_at"
+
+        # If query filters on products.name, ensure item revenue (items.price * items.quantity)
+        if wants_product_revenue:
+            try:
+                if _apply_product_revenue(tree, idx):
+                    notes += " | normalized:product_revenue"
+            except Exception:
+                pass
 
-            # coalesce sum to 0 for product revenue
-            for s in tree.find_all(exp.Select):
-                for i, sel in enumerate(s.expressions):
-                    if isinstance(sel, exp.Alias):
-                        target = sel.this
-                        if isinstance(target, exp.Sum):
-                            s.expressions[i] = exp.Alias(
-                                this=exp.Coalesce(this=target, expressions=[exp.Literal.number(0)]),
-                                alias=sel.alias,
-                            )
-                    elif isinstance(sel, exp.Sum):
-                        s.expressions[i] = exp.Coalesce(this=sel, expressions=[exp.Literal.number(0)])
-
-            plan = LLMQuery(
-                sql=_restore_params(tree.sql(dialect="postgres")),
-                expected_result=plan.expected_result,
-                notes=(plan.notes or "") + " | normalized:product_revenue",
-            )
-    except Exception:
-        pass
+        try:
+            plan = replace(plan, sql=_restore_params(tree.sql(dialect="postgres")), notes=notes)
+        except Exception:
+            pass
 
-    return LLMQuery(
-        sql=plan.sql.strip(),
-        expected_result=plan.expected_result,
-        notes=plan.notes,
-    )
+    return replace(plan, sql=plan.sql.strip())
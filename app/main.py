@@ -1,9 +1,17 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import os
+import signal
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+import orjson
 
 from fastapi import FastAPI, HTTPException, Body
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from openai import RateLimitError, OpenAIError
 from pydantic import BaseModel, Field
 
@@ -12,11 +20,45 @@ from app.sql_builder import build_sql
 from app.db import run_select, DatabaseError
 from app.sql_safety import UnsafeSQL
 from app.introspect import introspect_tables
-from app.llm_planner import question_to_sql
+from app import metrics
+from app.llm_planner import invalidate_question_cache, question_to_sql_async
 from app.verbalizer import verbalize_answer
 
 
-app = FastAPI(title="Restaurant BI Agent (MVP)")
+def _json_default(obj):
+    # Same shapes FastAPI's jsonable_encoder would produce for DB values.
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    return str(obj)
+
+
+class RowsResponse(ORJSONResponse):
+    """
+    orjson response for DB rows. Returned directly from handlers so FastAPI
+    skips its per-field jsonable_encoder walk over the result set.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(title="Restaurant BI Agent (MVP)", default_response_class=ORJSONResponse)
+
+# .env is loaded above; read env-derived settings once, not per request.
+STMT_TIMEOUT_ASK_MS = int(os.getenv("STATEMENT_TIMEOUT_MS_ASK", "30000"))
+STMT_TIMEOUT_RUNSQL_MS = int(os.getenv("STATEMENT_TIMEOUT_MS_RUNSQL", "8000"))
+DEFAULT_RESTAURANT = os.getenv("DEFAULT_RESTAURANT", "Gamba")
+
+
+def _on_sighup(signum, frame) -> None:
+    # `kill -HUP` drops cached plans. Signal handlers run on the main thread,
+    # possibly while it holds a cache lock, so clear from a helper thread.
+    threading.Thread(target=invalidate_question_cache, daemon=True).start()
+
+if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, _on_sighup)
 
 
 class QueryRequest(BaseModel):
@@ -32,7 +74,7 @@ def _pretty_sql(sql: str) -> str:
     return "\n".join(line.rstrip() for line in sql.strip().splitlines())
 
 def _default_restaurant() -> str:
-    return os.getenv("DEFAULT_RESTAURANT", "Gamba")
+    return DEFAULT_RESTAURANT
 
 @app.get("/restaurants")
 def restaurants():
@@ -41,10 +83,19 @@ def restaurants():
         "FROM sales GROUP BY restaurant ORDER BY sales_cnt DESC LIMIT 200;",
         preview=False
     )
-    return {"restaurants": rows}
+    return RowsResponse({"restaurants": rows})
+
+def _select_and_verbalize(question: str, plan, restaurant: str, preview: bool):
+    rows = run_select(
+        plan.sql,
+        params={"restaurant": restaurant},
+        preview=preview,
+        statement_timeout_ms=STMT_TIMEOUT_ASK_MS,
+    )
+    return rows, verbalize_answer(question, plan, rows)
 
 @app.post("/ask")
-def ask(
+async def ask(
     question: str = Body(..., media_type="text/plain"),
     include_data: bool = False,
     include_sql: bool = False,
@@ -52,25 +103,19 @@ def ask(
     restaurant: str | None = None,
 ):
     restaurant = restaurant or _default_restaurant()
-    plan = question_to_sql(question, restaurant=restaurant)
+    plan = await question_to_sql_async(question, restaurant=restaurant)
     try:
-        rows = run_select(
-        plan.sql,
-        params={"restaurant": restaurant},
-        preview=preview,
-        statement_timeout_ms=int(os.getenv("STATEMENT_TIMEOUT_MS_ASK", "30000")),
-        )
+        # one worker-thread hop for the query and the (CPU-only) verbalizer
+        rows, answer = await asyncio.to_thread(_select_and_verbalize, question, plan, restaurant, preview)
     except DatabaseError as e:
         # Always return SQL/params if requested, even on DB failures (timeouts, etc.)
         detail = {"db_error": str(e)}
         if include_sql:
             detail["sql"] = plan.sql
             detail["params"] = {"restaurant": restaurant}
-            detail["plan"] = plan.model_dump()
+            detail["plan"] = plan.as_dict()
         raise HTTPException(status_code=500, detail=detail)
 
-    answer = verbalize_answer(question, plan, rows)
-
     resp = {"message": answer}
 
     if include_data:
@@ -79,14 +124,19 @@ def ask(
     if include_sql:
         resp["sql"] = plan.sql
         resp["params"] = {"restaurant": restaurant}
-        resp["plan"] = plan.model_dump()
+        resp["plan"] = plan.as_dict()
 
-    return resp
+    return RowsResponse(resp)
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Prometheus text format: plan cache hit/miss and planner latency by path
+    return metrics.render()
+
 @app.post("/ask_plan")
 def ask_plan(plan: QueryPlan):
     built = build_sql(plan)
@@ -102,9 +152,9 @@ def run_sql(req: QueryRequest):
         rows = run_select(
         req.sql,
         preview=req.preview,
-        statement_timeout_ms=int(os.getenv("STATEMENT_TIMEOUT_MS_RUNSQL", "8000")),
+        statement_timeout_ms=STMT_TIMEOUT_RUNSQL_MS,
         )
-        return {"rows": rows, "row_count": len(rows)}
+        return RowsResponse({"rows": rows, "row_count": len(rows)})
     except UnsafeSQL as e:
         raise HTTPException(status_code=400, detail=f"Unsafe SQL: {e}")
     except DatabaseError as e:
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Tuple
+
+
+# Minimal in-process counters rendered in the Prometheus text format, so
+# /metrics can be scraped without pulling in prometheus_client.
+
+_LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.05, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LOCK = threading.Lock()
+_CACHE: DefaultDict[Tuple[str, str], int] = defaultdict(int)
+# path -> [bucket counts..., +Inf count, sum]
+_LATENCY: Dict[str, List[float]] = {}
+
+
+def cache_result(tier: str, hit: bool) -> None:
+    """Count a plan-cache lookup; tier is "exact" or "semantic"."""
+    with _LOCK:
+        _CACHE[(tier, "hit" if hit else "miss")] += 1
+
+
+def observe_plan(path: str, seconds: float) -> None:
+    """Record planner latency for the path that produced the answer."""
+    with _LOCK:
+        row = _LATENCY.get(path)
+        if row is None:
+            row = _LATENCY[path] = [0.0] * (len(_LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(_LATENCY_BUCKETS):
+            if seconds <= bound:
+                row[i] += 1
+        row[-2] += 1
+        row[-1] += seconds
+
+
+def render() -> str:
+    with _LOCK:
+        cache = sorted(_CACHE.items())
+        latency = {path: row[:] for path, row in sorted(_LATENCY.items())}
+
+    lines = [
+        "# HELP plan_cache_total Plan cache lookups by tier and result.",
+        "# TYPE plan_cache_total counter",
+    ]
+    for (tier, result), n in cache:
+        lines.append(f'plan_cache_total{{tier="{tier}",result="{result}"}} {n}')
+
+    lines.append("# HELP plan_latency_seconds Planner latency by answering path.")
+    lines.append("# TYPE plan_latency_seconds histogram")
+    for path, row in latency.items():
+        for bound, n in zip(_LATENCY_BUCKETS, row):
+            lines.append(f'plan_latency_seconds_bucket{{path="{path}",le="{bound}"}} {int(n)}')
+        lines.append(f'plan_latency_seconds_bucket{{path="{path}",le="+Inf"}} {int(row[-2])}')
+        lines.append(f'plan_latency_seconds_count{{path="{path}"}} {int(row[-2])}')
+        lines.append(f'plan_latency_seconds_sum{{path="{path}"}} {row[-1]}')
+    return "\n".join(lines) + "\n"
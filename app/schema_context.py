@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Any
 
@@ -8,51 +9,55 @@ from typing import Dict, List, Any
 _SCHEMA_PATH = Path(__file__).parent / "schema" / "fudo_schema.json"
 
 
+@lru_cache(maxsize=1)
 def load_schema() -> Dict[str, Any]:
+    # Parsed once per process; callers must treat the result as read-only.
     with _SCHEMA_PATH.open("r", encoding="utf-8") as f:
         return json.load(f)
 
 
+_PROMPT_HEADER = """\
+You are a SQL generator for a restaurant analytics database (Postgres).
+Return ONLY JSON with keys: sql, expected_result, notes.
+
+Business rules (must follow):
+- Always filter to completed sales: sales.sale_state = 'CLOSED'.
+- Always use created_at for time filters (never closed_at).
+- Gross sales default = SUM(sales.total).
+- Use payments.amount only when breaking down by payment method.
+- Use items.price * items.quantity for item revenue (items.price is historical).
+- If the question is about a specific product's sales/revenue, use items.price * items.quantity (not sales.total).
+- Do NOT use products.price for revenue (it's current price).
+- Always include restaurant scoping using %(restaurant)s param.
+- DB timezone is correct; no manual timezone conversion.
+
+Joins:
+- items.sale_id = sales.uuid
+- items.product_id = products.uuid
+- products.category_id = product_categories.uuid
+- product_categories.parent_category_id = product_categories.uuid
+- payments.sale_id = sales.uuid
+- payments.pay_method_id = payment_methods.uuid
+- discounts.sale_id = sales.uuid
+
+Tables:"""
+
+
+@lru_cache(maxsize=1)
 def schema_prompt() -> str:
     """
     Returns a concise schema + business rules prompt for the LLM.
+    Built once per process (the schema file doesn't change at runtime).
     """
-    data = load_schema()
-    tables: Dict[str, Any] = data.get("tables", {})
-
-    lines: List[str] = []
-    lines.append("You are a SQL generator for a restaurant analytics database (Postgres).")
-    lines.append("Return ONLY JSON with keys: sql, expected_result, notes.")
-    lines.append("")
-    lines.append("Business rules (must follow):")
-    lines.append("- Always filter to completed sales: sales.sale_state = 'CLOSED'.")
-    lines.append("- Always use created_at for time filters (never closed_at).")
-    lines.append("- Gross sales default = SUM(sales.total).")
-    lines.append("- Use payments.amount only when breaking down by payment method.")
-    lines.append("- Use items.price * items.quantity for item revenue (items.price is historical).")
-    lines.append("- If the question is about a specific product's sales/revenue, use items.price * items.quantity (not sales.total).")
-    lines.append("- Do NOT use products.price for revenue (it's current price).")
-    lines.append("- Always include restaurant scoping using %(restaurant)s param.")
-    lines.append("- DB timezone is correct; no manual timezone conversion.")
-    lines.append("")
-    lines.append("Joins:")
-    lines.append("- items.sale_id = sales.uuid")
-    lines.append("- items.product_id = products.uuid")
-    lines.append("- products.category_id = product_categories.uuid")
-    lines.append("- product_categories.parent_category_id = product_categories.uuid")
-    lines.append("- payments.sale_id = sales.uuid")
-    lines.append("- payments.pay_method_id = payment_methods.uuid")
-    lines.append("- discounts.sale_id = sales.uuid")
-    lines.append("")
-    lines.append("Tables:")
+    tables: Dict[str, Any] = load_schema().get("tables", {})
+
+    lines: List[str] = [_PROMPT_HEADER]
     for tname, tinfo in tables.items():
-        desc = tinfo.get("description") or ""
-        lines.append(f"- {tname}: {desc}")
-        for col in tinfo.get("columns", []):
-            cname = col.get("name")
-            ctype = col.get("type")
-            cdesc = col.get("description") or ""
-            lines.append(f"  - {cname} ({ctype}): {cdesc}")
+        lines.append(f"- {tname}: {tinfo.get('description') or ''}")
+        lines.extend(
+            f"  - {col.get('name')} ({col.get('type')}): {col.get('description') or ''}"
+            for col in tinfo.get("columns", [])
+        )
         lines.append("")
 
     return "\n".join(lines).strip()
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+_DEFAULT_RESTAURANT_PARAM = "%(restaurant)s"
 
 
 # -------------------------
 # Core schema structures
 # -------------------------
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Join:
     left_table: str
     left_key: str
@@ -17,7 +22,7 @@ class Join:
     join_type: str = "INNER"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TableSpec:
     name: str
     pk: str = "uuid"
@@ -48,7 +53,7 @@ class SchemaPack:
         # Tables
         # -------------------------
 
-        self.tables: Dict[str, TableSpec] = {
+        tables: Dict[str, TableSpec] = {
             # FACT TABLES
             "sales": TableSpec(
                 name="sales",
@@ -109,6 +114,8 @@ class SchemaPack:
                 restaurant_column="restaurant",
             ),
         }
+        # read-only view: the pack is a process-wide singleton
+        self.tables: Mapping[str, TableSpec] = MappingProxyType(tables)
 
         # -------------------------
         # Joins (explicit graph)
@@ -146,6 +153,19 @@ class SchemaPack:
             Join("expenses", "pay_method_id", "payment_methods", "uuid", "LEFT"),
         ]
 
+        # Join graph indexes: (a, b) -> Join for either direction, and
+        # table -> ((neighbor, Join), ...) in declaration order.
+        self._by_pair: Dict[Tuple[str, str], Join] = {}
+        adj: Dict[str, List[Tuple[str, Join]]] = defaultdict(list)
+        for j in self.joins:
+            self._by_pair.setdefault((j.left_table, j.right_table), j)
+            self._by_pair.setdefault((j.right_table, j.left_table), j)
+            adj[j.left_table].append((j.right_table, j))
+            adj[j.right_table].append((j.left_table, j))
+        self._adj: Dict[str, Tuple[Tuple[str, Join], ...]] = {
+            table: tuple(edges) for table, edges in adj.items()
+        }
+
         # -------------------------
         # Hierarchies
         # -------------------------
@@ -158,6 +178,12 @@ class SchemaPack:
             }
         }
 
+        # Default filters for the standard restaurant param, built once.
+        self._default_filters: Dict[str, Tuple[str, ...]] = {
+            name: tuple(self._build_filters(t, _DEFAULT_RESTAURANT_PARAM))
+            for name, t in self.tables.items()
+        }
+
     # -------------------------
     # Helpers
     # -------------------------
@@ -167,15 +193,30 @@ class SchemaPack:
             raise KeyError(f"Unknown table: {name}")
         return self.tables[name]
 
+    def get_join(self, a: str, b: str) -> Optional[Join]:
+        """Declared join between two tables (either direction), if any."""
+        return self._by_pair.get((a, b))
+
+    def neighbors(self, table: str) -> Tuple[Tuple[str, Join], ...]:
+        """Tables directly joinable to `table`, with the join to use."""
+        return self._adj.get(table, ())
+
     def default_filters_sql(
         self,
         table: str,
-        restaurant_param: str = "%(restaurant)s",
+        restaurant_param: str = _DEFAULT_RESTAURANT_PARAM,
     ) -> List[str]:
         """
         Default WHERE clauses applied unless explicitly overridden.
         """
-        t = self.get_table(table)
+        if restaurant_param == _DEFAULT_RESTAURANT_PARAM:
+            cached = self._default_filters.get(table)
+            if cached is not None:
+                return list(cached)
+        return self._build_filters(self.get_table(table), restaurant_param)
+
+    @staticmethod
+    def _build_filters(t: TableSpec, restaurant_param: str) -> List[str]:
         clauses: List[str] = []
 
         if t.restaurant_column:
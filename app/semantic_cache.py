@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, FrozenSet, List, Optional, Tuple
+
+
+# Tokens that change the meaning of a BI question even when the wording is
+# otherwise near-identical ("last week" vs "last month", "top 5" vs "top 10",
+# "gross" vs "net" sales). A cached answer is only reused when these match
+# exactly; everything else (entities, phrasing) is left to the embedding
+# threshold. "by <word>" is kept as one token so swapping the grouping
+# ("products by category" / "categories by product") changes the scope.
+_GUARD_RE = re.compile(
+    r"\b(?:by|por)\s+(?:the\s+|el\s+|la\s+|los\s+|las\s+)?(?P<dim>[^\W\d_]+)|"
+    r"\d+|"
+    r"\b(?:today|yesterday|tomorrow|day|days|week|weeks|month|months|year|years|"
+    r"hoy|ayer|dia|día|dias|días|semana|semanas|mes|meses|año|años|"
+    r"this|last|past|next|previous|este|esta|pasado|pasada|anterior|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"lunes|martes|miercoles|miércoles|jueves|viernes|sabado|sábado|domingo|"
+    r"gross|net|bruto|bruta|brutas|neto|neta|netas|"
+    r"sales|revenue|ventas|ingresos|facturación|facturacion|"
+    r"items|products|productos|expenses|gastos|payments|pagos|covers|comensales|"
+    r"tips|propinas|discounts|descuentos|average|avg|promedio|count|orders|pedidos|"
+    r"tickets|margin|margen|"
+    r"top|vs|versus|compare|comparar)\b",
+    re.IGNORECASE,
+)
+
+
+# Spellings that mean the same thing collapse to one guard token.
+_GUARD_ALIASES = {
+    "past": "last",
+    "previous": "last",
+    "pasado": "last",
+    "pasada": "last",
+    "anterior": "last",
+    "dia": "día",
+    "dias": "días",
+    "miercoles": "miércoles",
+    "sabado": "sábado",
+    "versus": "vs",
+    "bruto": "gross",
+    "bruta": "gross",
+    "brutas": "gross",
+    "neto": "net",
+    "neta": "net",
+    "netas": "net",
+    "revenue": "sales",
+    "ventas": "sales",
+    "ingresos": "sales",
+    "facturación": "sales",
+    "facturacion": "sales",
+    "productos": "products",
+    "gastos": "expenses",
+    "pagos": "payments",
+    "comensales": "covers",
+    "propinas": "tips",
+    "descuentos": "discounts",
+    "avg": "average",
+    "promedio": "average",
+    "pedidos": "orders",
+    "margen": "margin",
+}
+
+
+def enabled() -> bool:
+    return os.getenv("SEMANTIC_CACHE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _threshold() -> float:
+    return float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+
+def _embed_model() -> str:
+    return os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+
+
+def _guard_token(m: re.Match) -> str:
+    dim = m.group("dim")
+    if dim is not None:
+        dim = dim.lower()
+        return "by:" + _GUARD_ALIASES.get(dim, dim)
+    tok = m.group(0).lower()
+    return _GUARD_ALIASES.get(tok, tok)
+
+
+def guard_signature(question: str) -> FrozenSet[str]:
+    return frozenset(_guard_token(m) for m in _GUARD_RE.finditer(question))
+
+
+@dataclass(frozen=True)
+class _Entry:
+    vector: Tuple[float, ...]
+    scope: Tuple[Any, ...]
+    value: Any
+    expires_at: float
+
+
+_ENTRIES: Deque[_Entry] = deque(maxlen=int(os.getenv("SEMANTIC_CACHE_MAX", "512")))
+_LOCK = threading.Lock()
+
+
+def _unit(vec: List[float]) -> Tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return tuple(x / norm for x in vec)
+
+
+def embed(client: Any, question: str) -> Optional[Tuple[float, ...]]:
+    """
+    Unit-length embedding of the question, or None if the embeddings call
+    fails (the cache is best-effort and must never block an answer).
+    """
+    try:
+        resp = client.embeddings.create(model=_embed_model(), input=question, dimensions=256)
+        vec: List[float] = list(resp.data[0].embedding)
+    except Exception:
+        return None
+    return _unit(vec)
+
+
+async def embed_async(client: Any, question: str) -> Optional[Tuple[float, ...]]:
+    """embed() for an AsyncOpenAI client."""
+    try:
+        resp = await client.embeddings.create(model=_embed_model(), input=question, dimensions=256)
+        vec: List[float] = list(resp.data[0].embedding)
+    except Exception:
+        return None
+    return _unit(vec)
+
+
+def lookup(vector: Tuple[float, ...], scope: Tuple[Any, ...]) -> Optional[Any]:
+    """Best match with the same scope whose cosine similarity clears the threshold."""
+    best_score = _threshold()
+    best: Optional[Any] = None
+    now = time.monotonic()
+    with _LOCK:
+        entries = list(_ENTRIES)
+    for entry in entries:
+        if entry.scope != scope or entry.expires_at <= now:
+            continue
+        score = sum(a * b for a, b in zip(vector, entry.vector))
+        if score >= best_score:
+            best_score = score
+            best = entry.value
+    return best
+
+
+def store(vector: Tuple[float, ...], scope: Tuple[Any, ...], value: Any, ttl: float) -> None:
+    entry = _Entry(vector=vector, scope=scope, value=value, expires_at=time.monotonic() + ttl)
+    with _LOCK:
+        _ENTRIES.append(entry)
+
+
+def clear() -> None:
+    with _LOCK:
+        _ENTRIES.clear()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import redis
+
+from app.tenant_store import SESSION_FLAG_INCLUDE_SQL
+
+
+# Telegram chat sessions in Redis, one hash per chat. Drop-in replacement for
+# the session functions in tenant_store (same signatures, same row shape), so
+# the per-message session read skips SQLite when SESSION_REDIS_URL is set.
+
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", "86400"))
+
+
+@lru_cache(maxsize=1)
+def _client() -> redis.Redis:
+    return redis.Redis.from_url(os.environ["SESSION_REDIS_URL"], decode_responses=True)
+
+
+def _key(chat_id: int) -> str:
+    return f"bot:sess:{chat_id}"
+
+
+def get_session(chat_id: int) -> Optional[Dict[str, Any]]:
+    key = _key(chat_id)
+    # one round trip: read the hash and slide the idle TTL
+    pipe = _client().pipeline(transaction=False)
+    pipe.hgetall(key)
+    pipe.expire(key, SESSION_TTL_S)
+    raw, _ = pipe.execute()
+    if not raw or "user_id" not in raw:
+        return None
+    # Hash fields already update independently; pack them into the same
+    # flags bitfield the SQLite row has.
+    flags = SESSION_FLAG_INCLUDE_SQL if raw.get("include_sql") == "1" else 0
+    return {
+        "chat_id": chat_id,
+        "user_id": int(raw["user_id"]),
+        "selected_restaurants": raw.get("selected_restaurants"),
+        "language": raw.get("language"),
+        "flags": flags,
+    }
+
+
+def set_session(chat_id: int, user_id: int, selected_restaurants: Optional[str]) -> None:
+    key = _key(chat_id)
+    pipe = _client().pipeline()
+    pipe.hset(key, "user_id", user_id)
+    if selected_restaurants is None:
+        pipe.hdel(key, "selected_restaurants")
+    else:
+        pipe.hset(key, "selected_restaurants", selected_restaurants)
+    pipe.expire(key, SESSION_TTL_S)
+    pipe.execute()
+
+
+def _update_existing(chat_id: int, field: str, value: Any) -> None:
+    # Like the SQLite UPDATE: no-op unless the chat already has a session.
+    key = _key(chat_id)
+    client = _client()
+    if client.exists(key):
+        pipe = client.pipeline()
+        pipe.hset(key, field, value)
+        pipe.expire(key, SESSION_TTL_S)
+        pipe.execute()
+
+
+def set_session_language(chat_id: int, language: str) -> None:
+    _update_existing(chat_id, "language", language)
+
+
+def set_session_include_sql(chat_id: int, include_sql: bool) -> None:
+    _update_existing(chat_id, "include_sql", 1 if include_sql else 0)
+
+
+def clear_session(chat_id: int) -> None:
+    _client().delete(_key(chat_id))
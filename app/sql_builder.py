@@ -3,14 +3,70 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Dict, List, Set, Tuple
-from collections import deque, defaultdict
+from collections import deque
 
 from app.query_plan import QueryPlan
 from app.schema_pack import SCHEMA, Join
 from app.bi_semantics import SEMANTICS
 
 
+# Fixed SQL fragments used by the template builder.
+_TRUNC_UNITS: Dict[str, str] = {"day": "day", "week": "week", "month": "month"}
+_WHERE_SALES_RESTAURANT = "LOWER(sales.restaurant) = LOWER(%(restaurant)s)"
+_WHERE_SALES_CLOSED = "sales.sale_state = 'CLOSED'"
+_WHERE_ITEMS_NOT_CANCELED = "items.canceled IS NOT TRUE"
+_CLOSED_GATED_BASES = frozenset({"sales", "items"})
+
+
+# Trend complete-weeks query; str.format fields are filled per call, and
+# %(restaurant)s is left for psycopg.
+_TREND_SQL_TEMPLATE = """WITH bounds AS (
+    SELECT date_trunc('week', now())::timestamp AS week_start_current
+    ),
+    s AS (
+    SELECT s.uuid, s.created_at
+    FROM sales s
+    CROSS JOIN bounds b
+    WHERE LOWER(s.restaurant) = LOWER(%(restaurant)s)
+        AND s.sale_state = 'CLOSED'
+        AND s.created_at >= (b.week_start_current - interval '{total_days} days')
+        AND s.created_at <  b.week_start_current
+    ),
+    agg AS (
+    SELECT
+        i.product_id,
+        SUM(CASE WHEN s.created_at >= ((SELECT week_start_current FROM bounds) - interval '{recent_days} days')
+                THEN i.price * i.quantity ELSE 0 END) AS recent_rev,
+        SUM(CASE WHEN s.created_at <  ((SELECT week_start_current FROM bounds) - interval '{recent_days} days')
+                THEN i.price * i.quantity ELSE 0 END) AS prior_rev
+    FROM s
+    JOIN items i ON i.sale_id = s.uuid
+    WHERE i.canceled IS NOT TRUE
+    GROUP BY i.product_id
+    ),
+    ranked AS (
+    SELECT
+        product_id,
+        recent_rev,
+        prior_rev,
+        (recent_rev - prior_rev) AS delta,
+        CASE WHEN prior_rev = 0 THEN NULL ELSE (recent_rev - prior_rev) / prior_rev END AS pct_change
+    FROM agg
+    )
+    SELECT
+    p.name AS product,
+    recent_rev,
+    prior_rev,
+    delta,
+    pct_change
+    FROM ranked r
+    LEFT JOIN products p ON p.uuid = r.product_id
+    ORDER BY {order_expr}
+    LIMIT {limit};"""
+
+
 @dataclass(frozen=True)
 class BuiltQuery:
     sql: str
@@ -39,86 +95,82 @@ def resolve_time_field(base_table: str) -> Tuple[str, str]:
 # Minimal join planning via BFS paths
 # -------------------------
 
-def _build_adjacency() -> Dict[str, List[Tuple[str, Join]]]:
-    adj: Dict[str, List[Tuple[str, Join]]] = defaultdict(list)
-    for j in SCHEMA.joins:
-        adj[j.left_table].append((j.right_table, j))
-        adj[j.right_table].append((j.left_table, j))
-    return adj
-
-
-def _find_path_joins(start: str, target: str) -> List[Join]:
-    if start == target:
-        return []
-
-    adj = _build_adjacency()
+def _bfs_paths(start: str) -> Dict[str, Tuple[Join, ...]]:
+    """Shortest join path from `start` to every reachable table."""
     q = deque([start])
     prev: Dict[str, str | None] = {start: None}
     prev_join: Dict[str, Join] = {}
 
     while q:
         cur = q.popleft()
-        for nxt, join_obj in adj.get(cur, []):
+        for nxt, join_obj in SCHEMA.neighbors(cur):
             if nxt in prev:
                 continue
             prev[nxt] = cur
             prev_join[nxt] = join_obj
-            if nxt == target:
-                q.clear()
-                break
             q.append(nxt)
 
-    if target not in prev:
-        raise ValueError(f"No join path from '{start}' to '{target}'")
+    paths: Dict[str, Tuple[Join, ...]] = {}
+    for target in prev:
+        path: List[Join] = []
+        node = target
+        while prev[node] is not None:
+            path.append(prev_join[node])
+            node = prev[node]  # type: ignore[assignment]
+        path.reverse()
+        paths[target] = tuple(path)
+    return paths
+
+
+# All-pairs join paths, computed once: the schema graph is small and static.
+_PATHS: Dict[str, Dict[str, Tuple[Join, ...]]] = {
+    src: _bfs_paths(src) for src in SCHEMA.tables
+}
 
-    path: List[Join] = []
-    node = target
-    while prev[node] is not None:
-        path.append(prev_join[node])
-        node = prev[node]  # type: ignore[assignment]
-    path.reverse()
+
+def _find_path_joins(start: str, target: str) -> Tuple[Join, ...]:
+    if start == target:
+        return ()
+    path = _PATHS.get(start, {}).get(target)
+    if path is None:
+        raise ValueError(f"No join path from '{start}' to '{target}'")
     return path
 
 
+@lru_cache(maxsize=None)
+def _join_clause(present_table: str, joined_table: str) -> str:
+    # The schema is static; each clause is formatted once per table pair.
+    j = SCHEMA.get_join(present_table, joined_table)
+    if j is None:
+        raise ValueError(f"No join between '{present_table}' and '{joined_table}'")
+    return "%s JOIN %s ON %s.%s = %s.%s" % (
+        j.join_type, joined_table, j.left_table, j.left_key, j.right_table, j.right_key
+    )
+
+
 def _emit_join_clauses(base: str, joins_needed: List[Join]) -> List[str]:
+    """
+    joins_needed comes from _find_path_joins paths, each ordered from `base`
+    outward, so one pass suffices: every join touches a table already present.
+    """
     present: Set[str] = {base}
     clauses: List[str] = []
-
-    remaining = joins_needed[:]
-    for _ in range(30):
-        progressed = False
-        next_remaining: List[Join] = []
-
-        for j in remaining:
-            if j.left_table in present and j.right_table not in present:
-                clauses.append(
-                    f"{j.join_type} JOIN {j.right_table} "
-                    f"ON {j.left_table}.{j.left_key} = {j.right_table}.{j.right_key}"
-                )
-                present.add(j.right_table)
-                progressed = True
-            elif j.right_table in present and j.left_table not in present:
-                clauses.append(
-                    f"{j.join_type} JOIN {j.left_table} "
-                    f"ON {j.left_table}.{j.left_key} = {j.right_table}.{j.right_key}"
-                )
-                present.add(j.left_table)
-                progressed = True
-            else:
-                if j.left_table in present and j.right_table in present:
-                    progressed = True
-                else:
-                    next_remaining.append(j)
-
-        remaining = next_remaining
-        if not remaining:
-            break
-        if not progressed:
-            break
-
-    if remaining:
-        missing = sorted({j.left_table for j in remaining} | {j.right_table for j in remaining})
-        raise ValueError(f"Unable to emit join clauses; remaining tables: {missing}")
+    missing: Set[str] = set()
+
+    for j in joins_needed:
+        left_in = j.left_table in present
+        right_in = j.right_table in present
+        if left_in and not right_in:
+            clauses.append(_join_clause(j.left_table, j.right_table))
+            present.add(j.right_table)
+        elif right_in and not left_in:
+            clauses.append(_join_clause(j.right_table, j.left_table))
+            present.add(j.left_table)
+        elif not (left_in or right_in):
+            missing.update((j.left_table, j.right_table))
+
+    if missing:
+        raise ValueError(f"Unable to emit join clauses; remaining tables: {sorted(missing)}")
 
     return clauses
 
@@ -143,61 +195,79 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
         rank_by = plan.trend_rank_by or "delta"
         order_expr = "delta DESC" if rank_by == "delta" else "pct_change DESC NULLS LAST"
 
-        sql = f"""
-    WITH bounds AS (
-    SELECT date_trunc('week', now())::timestamp AS week_start_current
-    ),
-    s AS (
-    SELECT s.uuid, s.created_at
-    FROM sales s
-    CROSS JOIN bounds b
-    WHERE LOWER(s.restaurant) = LOWER(%(restaurant)s)
-        AND s.sale_state = 'CLOSED'
-        AND s.created_at >= (b.week_start_current - interval '{total_weeks * 7} days')
-        AND s.created_at <  b.week_start_current
-    ),
-    agg AS (
-    SELECT
-        i.product_id,
-        SUM(CASE WHEN s.created_at >= ((SELECT week_start_current FROM bounds) - interval '{recent_weeks * 7} days')
-                THEN i.price * i.quantity ELSE 0 END) AS recent_rev,
-        SUM(CASE WHEN s.created_at <  ((SELECT week_start_current FROM bounds) - interval '{recent_weeks * 7} days')
-                THEN i.price * i.quantity ELSE 0 END) AS prior_rev
-    FROM s
-    JOIN items i ON i.sale_id = s.uuid
-    WHERE i.canceled IS NOT TRUE
-    GROUP BY i.product_id
-    ),
-    ranked AS (
-    SELECT
-        product_id,
-        recent_rev,
-        prior_rev,
-        (recent_rev - prior_rev) AS delta,
-        CASE WHEN prior_rev = 0 THEN NULL ELSE (recent_rev - prior_rev) / prior_rev END AS pct_change
-    FROM agg
-    )
-    SELECT
-    p.name AS product,
-    recent_rev,
-    prior_rev,
-    delta,
-    pct_change
-    FROM ranked r
-    LEFT JOIN products p ON p.uuid = r.product_id
-    ORDER BY {order_expr}
-    LIMIT {limit};
-    """.strip()
+        sql = _TREND_SQL_TEMPLATE.format(
+            total_days=total_weeks * 7,
+            recent_days=recent_weeks * 7,
+            order_expr=order_expr,
+            limit=limit,
+        )
 
         return BuiltQuery(sql=sql, params={"restaurant": plan.restaurant})
 
-    # Normal path
-    metric_def = SEMANTICS.metric(plan.metric)
-    base = metric_def.base_table
+    # Normal path: the SQL text depends only on the plan's shape; values
+    # travel as psycopg params, so the template is cached per shape.
+    sql = _build_sql_template(_plan_signature(plan))
+    return BuiltQuery(sql=sql, params=_plan_params(plan))
+
+
+# Hashable plan shape: everything that affects the SQL text, no param values.
+_PlanSignature = Tuple[
+    str,  # metric
+    str,  # time_grain
+    Tuple[Tuple[str, str, "str | None"], ...],  # dimensions (table, column, alias)
+    bool,  # date_range.start present
+    bool,  # date_range.end present
+    int,  # len(comparison_dates), 0 when absent
+    int,  # len(comparison_ends), 0 when absent
+    "int | None",  # limit
+]
+
+
+def _plan_signature(plan: QueryPlan) -> _PlanSignature:
+    dr = plan.date_range
+    return (
+        plan.metric,
+        plan.time_grain,
+        tuple((d.table, d.column, d.alias) for d in plan.dimensions),
+        bool(dr and dr.start),
+        bool(dr and dr.end),
+        len(plan.comparison_dates) if plan.comparison_dates else 0,
+        len(plan.comparison_ends) if plan.comparison_ends else 0,
+        plan.limit,
+    )
 
-    # parameters (psycopg named placeholders)
+
+def _plan_params(plan: QueryPlan) -> Dict[str, Any]:
+    # parameters (psycopg named placeholders); shape was validated by the template build
     params: Dict[str, Any] = {"restaurant": plan.restaurant}
 
+    if plan.date_range:
+        if plan.date_range.start:
+            params["start_date"] = plan.date_range.start
+        if plan.date_range.end:
+            params["end_date"] = plan.date_range.end
+
+    if plan.comparison_dates:
+        params["cmp_start_1"] = plan.comparison_dates[0]
+        params["cmp_start_2"] = plan.comparison_dates[1]
+        if plan.time_grain == "month":
+            if plan.comparison_ends:
+                params["cmp_end_1"] = plan.comparison_ends[0]
+                params["cmp_end_2"] = plan.comparison_ends[1]
+        else:
+            params["cmp_date_1"] = plan.comparison_dates[0]
+            params["cmp_date_2"] = plan.comparison_dates[1]
+
+    return params
+
+
+@lru_cache(maxsize=512)
+def _build_sql_template(sig: _PlanSignature) -> str:
+    metric, time_grain, dimensions, has_start, has_end, n_cmp, n_cmp_ends, limit = sig
+
+    metric_def = SEMANTICS.metric(metric)
+    base = metric_def.base_table
+
     # time field
     time_table, time_col = resolve_time_field(base)
 
@@ -205,29 +275,29 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
     select_parts: List[str] = []
     group_by_aliases: List[str] = []
 
-    if plan.time_grain != "none":
-        trunc = {"day": "day", "week": "week", "month": "month"}[plan.time_grain]
+    if time_grain != "none":
+        trunc = _TRUNC_UNITS[time_grain]
         select_parts.append(f"DATE_TRUNC('{trunc}', {time_table}.{time_col}) AS period")
         group_by_aliases.append("period")
 
-    for dim in plan.dimensions:
-        alias = dim.alias or f"{dim.table}_{dim.column}"
-        select_parts.append(f"{dim.table}.{dim.column} AS {alias}")
+    for dim_table, dim_column, dim_alias in dimensions:
+        alias = dim_alias or f"{dim_table}_{dim_column}"
+        select_parts.append(f"{dim_table}.{dim_column} AS {alias}")
         group_by_aliases.append(alias)
 
     select_parts.append(f"{metric_def.expression_sql} AS value")
 
     # minimal join plan
-    required_tables: Set[str] = {base, time_table} | {d.table for d in plan.dimensions}
+    required_tables: Set[str] = {base, time_table} | {d[0] for d in dimensions}
 
+    # Join is a frozen dataclass, so it hashes by value and dedups directly.
     join_set: List[Join] = []
-    seen: Set[Tuple[str, str, str, str, str]] = set()
+    seen: Set[Join] = set()
 
     for t in sorted(required_tables):
         for j in _find_path_joins(base, t):
-            key = (j.left_table, j.left_key, j.right_table, j.right_key, j.join_type)
-            if key not in seen:
-                seen.add(key)
+            if j not in seen:
+                seen.add(j)
                 join_set.append(j)
 
     join_clauses = _emit_join_clauses(base, join_set)
@@ -237,21 +307,21 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
 
     # Restaurant filter: for items-based queries, filter on SALES (source of truth)
     if base == "items":
-        where_parts.append("LOWER(sales.restaurant) = LOWER(%(restaurant)s)")
+        where_parts.append(_WHERE_SALES_RESTAURANT)
     else:
         where_parts.append(f"LOWER({base}.restaurant) = LOWER(%(restaurant)s)")
 
     # Enforce CLOSED whenever we're using sales as the business "completed transaction" gate.
     # For items queries, sales is joined, so we enforce it too.
-    if base in ("sales", "items"):
-        where_parts.append("sales.sale_state = 'CLOSED'")
+    if base in _CLOSED_GATED_BASES:
+        where_parts.append(_WHERE_SALES_CLOSED)
 
     # Canceled flags
     # - For items analytics: ALWAYS exclude canceled items.
     # - For other bases: apply whatever SchemaPack declares.
     if base == "items":
         # treat NULL as "not canceled"
-        where_parts.append("items.canceled IS NOT TRUE")
+        where_parts.append(_WHERE_ITEMS_NOT_CANCELED)
     else:
         t = SCHEMA.get_table(base)
         if t.canceled_column:
@@ -259,37 +329,28 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
             where_parts.append(f"{base}.{t.canceled_column} IS NOT TRUE")
 
     # date range (inclusive start, inclusive whole end day)
-    if plan.date_range:
-        if plan.date_range.start:
-            params["start_date"] = plan.date_range.start
-            where_parts.append(f"{time_table}.{time_col} >= %(start_date)s")
-        if plan.date_range.end:
-            params["end_date"] = plan.date_range.end
-            where_parts.append(f"{time_table}.{time_col} < (%(end_date)s::date + interval '1 day')")
+    if has_start:
+        where_parts.append(f"{time_table}.{time_col} >= %(start_date)s")
+    if has_end:
+        where_parts.append(f"{time_table}.{time_col} < (%(end_date)s::date + interval '1 day')")
 
     # comparison_dates: restrict to specific days only
     # This is what enables "yesterday vs same day last week" to return only two rows.
-    if plan.comparison_dates:
-        if len(plan.comparison_dates) != 2:
+    if n_cmp:
+        if n_cmp != 2:
             raise ValueError("comparison_dates currently supports exactly 2 dates")
 
-        params["cmp_start_1"] = plan.comparison_dates[0]
-        params["cmp_start_2"] = plan.comparison_dates[1]
-
         # Month comparisons: always restrict to those month buckets
-        if plan.time_grain == "month":
+        if time_grain == "month":
             where_parts.append(
                 f"DATE_TRUNC('month', {time_table}.{time_col}) IN (%(cmp_start_1)s::date, %(cmp_start_2)s::date)"
             )
 
             # If we also have explicit ends, use two explicit ranges (MTD vs prior MTD)
-            if getattr(plan, "comparison_ends", None):
-                if len(plan.comparison_ends) != 2:
+            if n_cmp_ends:
+                if n_cmp_ends != 2:
                     raise ValueError("comparison_ends must have exactly 2 dates")
 
-                params["cmp_end_1"] = plan.comparison_ends[0]
-                params["cmp_end_2"] = plan.comparison_ends[1]
-
                 where_parts.append(
                     "("
                     f"({time_table}.{time_col} >= %(cmp_start_1)s::date AND {time_table}.{time_col} < (%(cmp_end_1)s::date + interval '1 day'))"
@@ -298,23 +359,13 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
                     ")"
                 )
         else:
-            # Day-level comparisons: pick exactly the 2 days
-            if getattr(plan, "comparison_ends", None):
-                # ignore ends for day comparisons
-                pass
-
-            params["cmp_date_1"] = plan.comparison_dates[0]
-            params["cmp_date_2"] = plan.comparison_dates[1]
+            # Day-level comparisons: pick exactly the 2 days (ends are ignored)
             where_parts.append(
                 f"DATE({time_table}.{time_col}) IN (%(cmp_date_1)s::date, %(cmp_date_2)s::date)"
             )
 
-    # assemble SQL
-    lines: List[str] = []
-    lines.append("SELECT")
-    lines.append("  " + ",\n  ".join(select_parts))
-    lines.append(f"FROM {base}")
-    lines.extend(join_clauses)
+    # assemble SQL: one buffer, one final join
+    lines: List[str] = ["SELECT", "  " + ",\n  ".join(select_parts), "FROM " + base, *join_clauses]
 
     if where_parts:
         lines.append("WHERE " + " AND ".join(where_parts))
@@ -325,10 +376,10 @@ def build_sql(plan: QueryPlan) -> BuiltQuery:
     # ordering
     if "period" in group_by_aliases:
         lines.append("ORDER BY period ASC")
-    elif plan.limit:
+    elif limit:
         lines.append("ORDER BY value DESC")
 
-    if plan.limit:
-        lines.append(f"LIMIT {int(plan.limit)}")
+    if limit:
+        lines.append("LIMIT %d" % int(limit))
 
-    return BuiltQuery(sql="\n".join(lines), params=params)
+    return "\n".join(lines)
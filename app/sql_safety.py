@@ -1,22 +1,62 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Tuple
-
-import sqlglot
-from sqlglot import expressions as exp
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Tuple
 
 import re
 
+if TYPE_CHECKING:
+    from sqlglot import expressions as exp
+
 _PARAM_RE = re.compile(r"%\([a-zA-Z_][a-zA-Z0-9_]*\)s")
 
+# Pre-filter run before sqlglot: literals, quoted identifiers and comments
+# are blanked out first so a value like 'update' can't trip the denylist.
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\$\$.*?\$\$|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_DENY_RE = re.compile(r"\b(?:insert|update|delete|drop|alter|truncate|grant|revoke|create)\b", re.IGNORECASE)
+_MULTI_STMT_RE = re.compile(r";\s*\S")
+_ROW_CAP_RE = re.compile(r"\b(?:limit|fetch)\b", re.IGNORECASE)
+
 def _sanitize_psycopg_named_params(sql: str) -> str:
     """
     Replace psycopg named params like %(restaurant)s with a neutral literal
     so sqlglot can parse the SQL.
     """
+    if "%(" not in sql:
+        # hand-written SQL without params: skip the regex scan
+        return sql
     return _PARAM_RE.sub("NULL", sql)
 
+_FORBIDDEN_NAMES = (
+    "Insert",
+    "Update",
+    "Delete",
+    "Create",
+    "Alter",
+    "Drop",
+    "Truncate",
+    "Command",
+    "Grant",
+    "Revoke",
+)
+
+
+@lru_cache(maxsize=1)
+def _sqlglot():
+    """
+    sqlglot is a heavy import; load it on the first validation rather than
+    whenever db.py (and with it ensure_limit) is imported. Also resolves the
+    mutation node types rejected anywhere in the tree, skipping any this
+    sqlglot version doesn't define.
+    """
+    import sqlglot
+    from sqlglot import expressions as exp
+
+    forbidden = tuple(cls for cls in (getattr(exp, n, None) for n in _FORBIDDEN_NAMES) if cls is not None)
+    return sqlglot, exp, forbidden
+
+
 class UnsafeSQL(Exception):
     pass
 
@@ -28,6 +68,7 @@ class SafetyResult:
 
 
 def _is_select_statement(tree: exp.Expression) -> bool:
+    _, exp, _ = _sqlglot()
     # Allow WITH ... SELECT ...
     if isinstance(tree, exp.Select):
         return True
@@ -41,9 +82,30 @@ def validate_select_only(sql: str) -> SafetyResult:
     if not sql or not sql.strip():
         raise UnsafeSQL("Empty SQL.")
 
+    # Keyed on the sanitized text, so the same query with different param
+    # names/values hits one entry. Rejections raise and aren't cached.
+    has_limit = _check_select_only(_sanitize_psycopg_named_params(sql))
+    return SafetyResult(normalized_sql=sql.strip(), has_limit=has_limit)
+
+
+@lru_cache(maxsize=1024)
+def _check_select_only(sql_for_parse: str) -> bool:
+    """Raises UnsafeSQL unless this is a single read-only SELECT; returns has_limit."""
+    # Obviously bad input is rejected without a parse; anything that passes
+    # still gets the full AST check below.
+    bare = _QUOTED_RE.sub(" ", sql_for_parse)
+    if _MULTI_STMT_RE.search(bare):
+        raise UnsafeSQL("Multiple SQL statements are not allowed.")
+    denied = _DENY_RE.search(bare)
+    if denied:
+        if not bare[: denied.start()].strip():
+            raise UnsafeSQL("Only SELECT queries are allowed.")
+        raise UnsafeSQL("DDL/DML statements are not allowed.")
+
+    sqlglot, exp, forbidden = _sqlglot()
+
     # Parse; reject multiple statements
     try:
-        sql_for_parse = _sanitize_psycopg_named_params(sql)
         trees = sqlglot.parse(sql_for_parse, read="postgres")
     except Exception as e:
         raise UnsafeSQL(f"SQL parse error: {e}")
@@ -56,38 +118,25 @@ def validate_select_only(sql: str) -> SafetyResult:
     if not _is_select_statement(tree):
         raise UnsafeSQL("Only SELECT queries are allowed.")
 
-    # Basic denylist via AST inspection: block any mutation nodes
-    def _maybe(node_name: str):
-        return getattr(exp, node_name, None)
-
-    forbidden_names = [
-        "Insert",
-        "Update",
-        "Delete",
-        "Create",
-        "Alter",
-        "Drop",
-        "Truncate",
-        "Command",
-        "Grant",
-        "Revoke",
-    ]
-    forbidden = tuple(x for x in (_maybe(n) for n in forbidden_names) if x is not None)
-
+    # One pass: block any mutation nodes (basic denylist) and detect LIMIT/FETCH
+    has_limit = False
     for node in tree.walk():
-        if forbidden and isinstance(node, forbidden):
+        if isinstance(node, forbidden):
             raise UnsafeSQL("DDL/DML statements are not allowed.")
+        if isinstance(node, (exp.Limit, exp.Fetch)):
+            has_limit = True
 
-    # Detect limit
-    has_limit = any(isinstance(node, exp.Limit) for node in tree.walk())
-
-    return SafetyResult(normalized_sql=sql.strip(), has_limit=has_limit)
+    return has_limit
 
 
-def ensure_limit(sql: str, limit: int) -> str:
+def ensure_limit(sql: str, limit: int, has_limit: Optional[bool] = None) -> str:
     """
-    Add LIMIT if absent by wrapping the query.
-    This is more robust across sqlglot versions than AST mutation.
+    Cap the row count at `limit`.
+
+    Without a LIMIT/FETCH of its own the query just gets a LIMIT appended;
+    otherwise it is wrapped, so the existing limit can't exceed the cap.
+    has_limit, when the caller already knows it (SafetyResult.has_limit),
+    skips the keyword scan.
     """
     sql = (sql or "").strip()
     if not sql:
@@ -97,6 +146,13 @@ def ensure_limit(sql: str, limit: int) -> str:
     if sql.endswith(";"):
         sql = sql[:-1].strip()
 
+    if has_limit is None:
+        has_limit = _ROW_CAP_RE.search(_QUOTED_RE.sub(" ", sql)) is not None
+
+    if not has_limit:
+        # newline, in case the query ends in a -- comment
+        return f"{sql}\nLIMIT {int(limit)}"
+
     # Wrap to avoid dialect/AST differences:
     # SELECT * FROM (<original query>) AS __q LIMIT <n>;
     return f"SELECT * FROM ({sql}) AS __q LIMIT {int(limit)}"
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import logging
 import os
-from typing import List, Optional, Tuple
+import re
+from typing import Any, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -15,28 +20,34 @@ from telegram.ext import (
 )
 
 from app.auth import hash_password, verify_password
-from app.db import run_select
-from app.llm_planner import question_to_sql
+from app.db import DatabaseError, get_pool, run_select
+from app.llm_planner import question_to_sql_async
 from app.tenant_store import (
     init_db,
     get_user_by_email,
     get_user_by_id,
-    set_session,
-    get_session,
-    clear_session,
     list_dsns,
     create_dsn,
     sync_restaurants_from_dsn,
-    list_accessible_restaurants,
-    list_restaurants_by_dsn,
+    list_accessible_restaurant_names,
+    list_restaurant_id_by_name,
     get_dsn_by_id,
+    get_user_with_dsn,
     create_user,
     set_user_restaurants,
-    set_session_language,
-    set_session_include_sql,
+    SESSION_FLAG_INCLUDE_SQL,
 )
 from app.verbalizer import verbalize_answer
 
+if os.getenv("SESSION_REDIS_URL"):
+    # Chat sessions are read on every update; keep them in Redis and leave
+    # users/DSNs/restaurants in the control DB.
+    from app import session_store_redis as session_store
+else:
+    from app import tenant_store as session_store
+
+
+logger = logging.getLogger(__name__)
 
 LOGIN_EMAIL, LOGIN_PASSWORD = range(2)
 ADD_DSN_NAME, ADD_DSN_VALUE, ADD_DSN_CONFIRM = range(2, 5)
@@ -51,46 +62,64 @@ def _token() -> str:
     return token
 
 
-def _session_user(chat_id: int) -> Optional[int]:
-    sess = get_session(chat_id)
+# Session helpers read from the row returned by get_session; handlers load
+# it once per update and pass it in instead of re-querying per field.
+_Session = Optional[Dict[str, Any]]
+
+
+def _session_user(sess: _Session) -> Optional[int]:
     if not sess:
         return None
     return sess.get("user_id")
 
 
-def _selected_restaurants(chat_id: int) -> List[str]:
-    sess = get_session(chat_id)
+def _selected_restaurants(sess: _Session) -> List[str]:
     if not sess:
         return []
     raw = sess.get("selected_restaurants") or ""
     return [r.strip() for r in raw.split(",") if r.strip()]
 
 
-def _session_language(chat_id: int) -> str:
-    sess = get_session(chat_id)
+def _session_language(sess: _Session) -> str:
     if not sess:
         return "en"
     lang = sess.get("language") or "en"
     return "es" if lang == "es" else "en"
 
 
-def _session_include_sql(chat_id: int) -> bool:
-    sess = get_session(chat_id)
+def _session_include_sql(sess: _Session) -> bool:
     if not sess:
         return False
-    val = sess.get("include_sql")
-    return bool(val) if val is not None else False
+    return bool((sess.get("flags") or 0) & SESSION_FLAG_INCLUDE_SQL)
+
+
+# Both session backends are blocking (SQLite file / Redis socket), so every
+# call runs off the event loop.
+async def _get_session(chat_id: int) -> _Session:
+    return await asyncio.to_thread(session_store.get_session, chat_id)
+
+
+async def _set_session(chat_id: int, user_id: int, selected_restaurants: Optional[str]) -> None:
+    await asyncio.to_thread(session_store.set_session, chat_id, user_id, selected_restaurants)
+
+
+async def _clear_session(chat_id: int) -> None:
+    await asyncio.to_thread(session_store.clear_session, chat_id)
 
 
-def _set_selected_restaurants(chat_id: int, user_id: int, restaurants: List[str]) -> None:
+async def _set_selected_restaurants(chat_id: int, user_id: int, restaurants: List[str]) -> None:
     raw = ", ".join(restaurants) if restaurants else None
-    set_session(chat_id, user_id, raw)
+    await _set_session(chat_id, user_id, raw)
 
 
 def _parse_csv(text: str) -> List[str]:
     return [t.strip() for t in (text or "").split(",") if t.strip()]
 
 
+# "= %(restaurant)s" or "= LOWER(%(restaurant)s)", rewritten in one pass
+_SCOPE_RE = re.compile(r"= (?:LOWER\(%\(restaurant\)s\)|%\(restaurant\)s)")
+
+
 def _apply_restaurant_scope(sql: str, restaurants: List[str]) -> Tuple[str, dict]:
     if not restaurants:
         return sql, {}
@@ -98,9 +127,7 @@ def _apply_restaurant_scope(sql: str, restaurants: List[str]) -> Tuple[str, dict
         return sql, {"restaurant": restaurants[0]}
 
     # Try to replace common equality filter with ANY for multiple restaurants
-    updated = sql
-    updated = updated.replace("= %(restaurant)s", "= ANY(%(restaurants)s)")
-    updated = updated.replace("= LOWER(%(restaurant)s)", "= ANY(%(restaurants)s)")
+    updated = _SCOPE_RE.sub("= ANY(%(restaurants)s)", sql)
     params = {"restaurants": restaurants}
     return updated, params
 
@@ -112,16 +139,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+_BASE_CMDS = ["/restaurants", "/language", "/debug", "/whoami", "/logout", "/menu", "/help"]
+
+# Menu text per role, built once; roles without admin commands get "user".
+_MENU_TEXTS = {
+    "anon": "Commands:\n/login\n/logout\n/menu",
+    "user": "Commands:\n" + "\n".join(_BASE_CMDS),
+    "admin": "Commands:\n" + "\n".join(_BASE_CMDS + ["/add_user"]),
+    "superuser": "Commands:\n" + "\n".join(_BASE_CMDS + ["/add_dsn", "/add_user"]),
+}
+
+
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
-    user_id = _session_user(chat_id)
+    user_id = _session_user(await _get_session(update.effective_chat.id))
     if not user_id:
-        await update.message.reply_text(
-            "Commands:\n"
-            "/login\n"
-            "/logout\n"
-            "/menu"
-        )
+        await update.message.reply_text(_MENU_TEXTS["anon"])
         return
 
     user = get_user_by_id(user_id)
@@ -129,24 +161,12 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Session invalid. Please /login again.")
         return
 
-    base_cmds = ["/restaurants", "/language", "/debug", "/whoami", "/logout", "/menu", "/help"]
-    admin_cmds = []
-    if user.role == "superuser":
-        admin_cmds.extend(["/add_dsn", "/add_user"])
-    elif user.role == "admin":
-        admin_cmds.append("/add_user")
-
-    msg = "Commands:\n" + "\n".join(base_cmds + admin_cmds)
-    await update.message.reply_text(msg)
-
-
-async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await menu(update, context)
+    await update.message.reply_text(_MENU_TEXTS.get(user.role, _MENU_TEXTS["user"]))
 
 
 async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
-    user_id = _session_user(chat_id)
+    sess = await _get_session(update.effective_chat.id)
+    user_id = _session_user(sess)
     if not user_id:
         await update.message.reply_text("You are not logged in. Use /login.")
         return
@@ -155,21 +175,21 @@ async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Session invalid. Please /login again.")
         return
     dsn = get_dsn_by_id(user.dsn_id) if user.dsn_id else None
-    selected = _selected_restaurants(chat_id)
+    selected = _selected_restaurants(sess)
     msg = (
         f"Email: {user.email}\n"
         f"Role: {user.role}\n"
         f"DSN: {dsn['name'] if dsn else 'none'}\n"
         f"Selected restaurants: {', '.join(selected) if selected else 'none'}\n"
-        f"Language: {_session_language(chat_id)}\n"
-        f"Include SQL: {'on' if _session_include_sql(chat_id) else 'off'}"
+        f"Language: {_session_language(sess)}\n"
+        f"Include SQL: {'on' if _session_include_sql(sess) else 'off'}"
     )
     await update.message.reply_text(msg)
 
 
 async def language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    user_id = _session_user(chat_id)
+    user_id = _session_user(await _get_session(chat_id))
     if not user_id:
         await update.message.reply_text("Please /login first.")
         return
@@ -182,13 +202,13 @@ async def language(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if lang not in ("en", "es"):
         await update.message.reply_text("Invalid language. Use /language en or /language es.")
         return
-    set_session_language(chat_id, lang)
+    await asyncio.to_thread(session_store.set_session_language, chat_id, lang)
     await update.message.reply_text(f"Language set to {lang}.")
 
 
 async def debug(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    user_id = _session_user(chat_id)
+    user_id = _session_user(await _get_session(chat_id))
     if not user_id:
         await update.message.reply_text("Please /login first.")
         return
@@ -201,13 +221,13 @@ async def debug(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if flag not in ("on", "off"):
         await update.message.reply_text("Invalid option. Use /debug on or /debug off.")
         return
-    set_session_include_sql(chat_id, flag == "on")
+    await asyncio.to_thread(session_store.set_session_include_sql, chat_id, flag == "on")
     await update.message.reply_text(f"Debug SQL is now {flag}.")
 
 
 async def login_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
-    if _session_user(chat_id):
+    if _session_user(await _get_session(chat_id)):
         await update.message.reply_text("You are already logged in. Use /logout to end the session.")
         return ConversationHandler.END
     await update.message.reply_text("Email:")
@@ -224,10 +244,11 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     email = context.user_data.get("email")
     password = update.message.text or ""
     user = get_user_by_email(email)
-    if not user or not verify_password(password, user.password_hash):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await asyncio.to_thread(verify_password, password, user.password_hash):
         await update.message.reply_text("Invalid credentials. Try /login again.")
         return ConversationHandler.END
-    set_session(update.effective_chat.id, user.id, None)
+    await _set_session(update.effective_chat.id, user.id, None)
     await update.message.reply_text(
         "Logged in.\n"
         "Next, choose a restaurant with /restaurants."
@@ -236,12 +257,12 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    clear_session(update.effective_chat.id)
+    await _clear_session(update.effective_chat.id)
     await update.message.reply_text("Logged out.")
 
 
 async def restaurants_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    user_id = _session_user(update.effective_chat.id)
+    user_id = _session_user(await _get_session(update.effective_chat.id))
     if not user_id:
         await update.message.reply_text("Please /login first.")
         return ConversationHandler.END
@@ -249,11 +270,12 @@ async def restaurants_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not user:
         await update.message.reply_text("Session invalid. Please /login again.")
         return ConversationHandler.END
-    restaurants = list_accessible_restaurants(user)
-    if not restaurants:
+    names = list_accessible_restaurant_names(user)
+    if not names:
         await update.message.reply_text("No restaurants available for your account.")
         return ConversationHandler.END
-    names = [r["name"] for r in restaurants]
+    # reused by restaurants_select; tagged with the user in case of a re-login
+    context.user_data["restaurant_choices"] = (user.id, names)
     await update.message.reply_text(
         "Select restaurant(s) by replying with a comma-separated list of names or numbers:\n"
         + "\n".join([f"{i+1}. {n}" for i, n in enumerate(names)])
@@ -262,7 +284,7 @@ async def restaurants_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def restaurants_select(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    user_id = _session_user(update.effective_chat.id)
+    user_id = _session_user(await _get_session(update.effective_chat.id))
     if not user_id:
         await update.message.reply_text("Please /login first.")
         return ConversationHandler.END
@@ -270,23 +292,21 @@ async def restaurants_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not user:
         await update.message.reply_text("Session invalid. Please /login again.")
         return ConversationHandler.END
-    restaurants = list_accessible_restaurants(user)
-    names = [r["name"] for r in restaurants]
-    allowed = {r["name"] for r in restaurants}
+    choices = context.user_data.pop("restaurant_choices", None)
+    if choices and choices[0] == user.id:
+        names = choices[1]
+    else:
+        names = list_accessible_restaurant_names(user)
+    # One lookup for names and 1-based numbers; numbers go in last so they
+    # always mean a list position.
+    lookup = {n: n for n in names}
+    lookup.update((str(i + 1), n) for i, n in enumerate(names))
     raw = _parse_csv(update.message.text or "")
-    selected: List[str] = []
-    for token in raw:
-        if token.isdigit():
-            idx = int(token) - 1
-            if 0 <= idx < len(names):
-                selected.append(names[idx])
-        elif token in allowed:
-            selected.append(token)
-    selected = list(dict.fromkeys(selected))
+    selected = list(dict.fromkeys(lookup[t] for t in raw if t in lookup))
     if not selected:
         await update.message.reply_text("No valid restaurants selected. Try /restaurants again.")
         return ConversationHandler.END
-    _set_selected_restaurants(update.effective_chat.id, user_id, selected)
+    await _set_selected_restaurants(update.effective_chat.id, user_id, selected)
     await update.message.reply_text(
         f"Selected restaurants: {', '.join(selected)}\n\n"
         "You can now ask questions in English, for example:\n"
@@ -296,7 +316,7 @@ async def restaurants_select(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def add_dsn_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    user_id = _session_user(update.effective_chat.id)
+    user_id = _session_user(await _get_session(update.effective_chat.id))
     user = get_user_by_id(user_id) if user_id else None
     if not user or user.role != "superuser":
         await update.message.reply_text("Unauthorized.")
@@ -331,7 +351,7 @@ async def add_dsn_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def add_user_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    user_id = _session_user(update.effective_chat.id)
+    user_id = _session_user(await _get_session(update.effective_chat.id))
     user = get_user_by_id(user_id) if user_id else None
     if not user or user.role not in ("superuser", "admin"):
         await update.message.reply_text("Unauthorized.")
@@ -358,7 +378,7 @@ async def add_user_role(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await update.message.reply_text("Invalid role. Choose admin, db_admin, or user.")
         return ADD_USER_ROLE
     context.user_data["new_role"] = role
-    admin_user_id = _session_user(update.effective_chat.id)
+    admin_user_id = _session_user(await _get_session(update.effective_chat.id))
     admin_user = get_user_by_id(admin_user_id) if admin_user_id else None
     if admin_user and admin_user.role == "admin":
         # admins can only create users for their own DSN
@@ -402,11 +422,12 @@ async def add_user_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if answer in ("yes", "y"):
         context.user_data["limit_restaurants"] = True
         dsn_id = context.user_data.get("new_dsn_id")
-        restaurants = list_restaurants_by_dsn(dsn_id)
-        if not restaurants:
+        id_by_name = list_restaurant_id_by_name(dsn_id)
+        if not id_by_name:
             await update.message.reply_text("No restaurants found for this DSN.")
             return ConversationHandler.END
-        msg = "List allowed restaurants (comma-separated):\n" + "\n".join([r["name"] for r in restaurants])
+        context.user_data["dsn_restaurants"] = id_by_name
+        msg = "List allowed restaurants (comma-separated):\n" + "\n".join(id_by_name)
         await update.message.reply_text(msg)
         return ADD_USER_RESTAURANTS
     await update.message.reply_text("Please answer yes or no.")
@@ -430,13 +451,14 @@ async def add_user_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     role = context.user_data.get("new_role")
     dsn_id = context.user_data.get("new_dsn_id")
 
-    pwd_hash = hash_password(password)
+    pwd_hash = await asyncio.to_thread(hash_password, password)
     user_id = create_user(email, pwd_hash, role=role, dsn_id=dsn_id)
 
     if context.user_data.get("limit_restaurants"):
         names = context.user_data.get("new_restaurants", [])
-        restaurants = list_restaurants_by_dsn(dsn_id)
-        allowed_map = {r["name"]: r["id"] for r in restaurants}
+        allowed_map = context.user_data.pop("dsn_restaurants", None)
+        if allowed_map is None:
+            allowed_map = list_restaurant_id_by_name(dsn_id)
         ids = [allowed_map[n] for n in names if n in allowed_map]
         set_user_restaurants(user_id, ids)
 
@@ -444,49 +466,63 @@ async def add_user_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return ConversationHandler.END
 
 
+def _select_and_verbalize(question: str, plan, sql: str, params: dict, dsn: str, language: str) -> str:
+    rows = run_select(
+        sql,
+        params=params,
+        preview=True,
+        statement_timeout_ms=int(os.getenv("STATEMENT_TIMEOUT_MS_ASK", "30000")),
+        dsn=dsn,
+    )
+    return verbalize_answer(question, plan, rows, language=language)
+
+
 async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
-    user_id = _session_user(chat_id)
+    sess = await _get_session(update.effective_chat.id)
+    user_id = _session_user(sess)
     if not user_id:
         await update.message.reply_text("Please /login first.")
         return
-    user = get_user_by_id(user_id)
+    user, dsn = get_user_with_dsn(user_id)
     if not user or user.dsn_id is None:
         await update.message.reply_text("No DSN assigned. Contact admin.")
         return
-    restaurants = _selected_restaurants(chat_id)
+    restaurants = _selected_restaurants(sess)
     if not restaurants:
         await update.message.reply_text("Select restaurant with /restaurants first.")
         return
 
-    dsn = get_dsn_by_id(user.dsn_id)
     if not dsn:
         await update.message.reply_text("DSN not found.")
         return
 
     question = update.message.text or ""
-    plan = question_to_sql(question, restaurant=restaurants[0])
+    plan = await question_to_sql_async(question, restaurant=restaurants[0])
     sql, params = _apply_restaurant_scope(plan.sql, restaurants)
     if "restaurant" not in params and "restaurants" not in params:
         params = {"restaurant": restaurants[0]}
 
-    rows = run_select(
-        sql,
-        params=params,
-        preview=True,
-        statement_timeout_ms=int(os.getenv("STATEMENT_TIMEOUT_MS_ASK", "30000")),
-        dsn=dsn["dsn"],
+    # psycopg is blocking: run the query and the (CPU-only) verbalizer in one
+    # worker-thread hop so the event loop keeps serving other chats.
+    answer = await asyncio.to_thread(
+        _select_and_verbalize, question, plan, sql, params, dsn["dsn"], _session_language(sess)
     )
-
-    language = _session_language(chat_id)
-    answer = verbalize_answer(question, plan, rows, language=language)
-    if _session_include_sql(chat_id):
+    if _session_include_sql(sess):
         answer = f"{answer}\n\nSQL:\n{sql}"
     await update.message.reply_text(answer)
 
 
+def _warm_pools() -> None:
+    # Opt-in: every tenant then holds PG_POOL_MIN idle connections for the
+    # life of the bot, used or not. Otherwise pools open on first question.
+    for dsn in list_dsns():
+        try:
+            get_pool(dsn["dsn"])
+        except DatabaseError as e:
+            logger.warning("pool warm-up failed for DSN %r: %s", dsn["name"], e)
+
+
 def build_app():
-    load_dotenv()
     init_db()
     async def post_init(app):
         commands = [
@@ -504,18 +540,30 @@ def build_app():
         ]
         await app.bot.set_my_commands(commands)
 
+        if os.getenv("PG_POOL_WARMUP", "").strip().lower() in ("1", "true", "yes", "on"):
+            await asyncio.to_thread(_warm_pools)
+
+    # Updates stay sequential: the ConversationHandlers (login, add_user, ...)
+    # need that to see each step in order. Slow questions don't hold up other
+    # chats because handle_question is registered with block=False.
     return ApplicationBuilder().token(_token()).post_init(post_init).build()
 
 
 def main() -> None:
+    try:
+        # faster event loop for the polling/HTTP traffic; not on Windows
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     app = build_app()
 
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("whoami", whoami))
     app.add_handler(CommandHandler("language", language))
     app.add_handler(CommandHandler("debug", debug))
-    app.add_handler(CommandHandler("menu", menu))
+    app.add_handler(CommandHandler(["menu", "help"], menu))
     app.add_handler(CommandHandler("logout", logout))
 
     login_conv = ConversationHandler(
@@ -561,9 +609,23 @@ def main() -> None:
     )
     app.add_handler(add_user_conv)
 
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_question))
-
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_question, block=False))
+
+    # Only plain messages are handled (handlers read update.message).
+    public_url = os.getenv("PUBLIC_URL", "").strip().rstrip("/")
+    if public_url:
+        # Webhook: Telegram pushes updates as they arrive, no polling loop.
+        token = _token()
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", "8443")),
+            url_path=token,
+            webhook_url=f"{public_url}/{token}",
+            allowed_updates=[Update.MESSAGE],
+        )
+    else:
+        # Long-poll (30s) so idle periods cost one getUpdates request per 30s.
+        app.run_polling(allowed_updates=[Update.MESSAGE], timeout=30)
 
 
 if __name__ == "__main__":
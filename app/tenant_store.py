@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import atexit
+import json
 import os
 import sqlite3
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+from pathlib import Path
+from time import monotonic
+from typing import Optional, List, Dict, Any, Tuple
 
 import psycopg
 
@@ -20,78 +26,171 @@ class User:
     dsn_id: Optional[int]
 
 
-def _connect(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+# One connection per (thread, db file), reused for the life of the thread.
+# `with _connect(...) as conn:` only scopes a transaction (commit/rollback);
+# sqlite3's context manager never closes the connection.
+_LOCAL = threading.local()
+_ALL_CONNS: List[sqlite3.Connection] = []
+_ALL_CONNS_LOCK = threading.Lock()
+
+
+def _connect(db_path: str = DEFAULT_DB_PATH, readonly: bool = False) -> sqlite3.Connection:
+    """
+    This thread's connection to db_path. readonly=True gives a separate
+    mode=ro handle for the getters: it can never take the write lock, so
+    reads don't queue behind a writer on the same file.
+    """
+    conns: Optional[Dict[Tuple[str, bool], sqlite3.Connection]] = getattr(_LOCAL, "conns", None)
+    if conns is None:
+        conns = _LOCAL.conns = {}
+    conn = conns.get((db_path, readonly))
+    if conn is None:
+        # Queries here are fixed strings, so sqlite3's per-connection statement
+        # cache (keyed by SQL text) skips re-preparing them; size it for all.
+        if readonly:
+            uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=256)
+        else:
+            conn = sqlite3.connect(db_path, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 5000")
+        # Safe with WAL (set once in init_db): commits skip the fsync until
+        # checkpoint; temp tables and sorts stay in memory.
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")
+        conns[(db_path, readonly)] = conn
+        with _ALL_CONNS_LOCK:
+            _ALL_CONNS.append(conn)
     return conn
 
 
+@atexit.register
+def _close_all() -> None:
+    with _ALL_CONNS_LOCK:
+        for conn in _ALL_CONNS:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _ALL_CONNS.clear()
+
+
+# Short-lived LRU for the rows read on every bot update (user, DSN, chat
+# session). Only hits are cached; this module's writers drop what they change,
+# and edits from other processes (admin_cli) show up within the TTL. Cached
+# values are shared: callers must not mutate them.
+_CACHE: "OrderedDict[Tuple[str, str, Any], Tuple[float, Any]]" = OrderedDict()
+_CACHE_MAX = 4096
+_CACHE_TTL_S = 60.0
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(key: Tuple[str, str, Any]) -> Any:
+    with _CACHE_LOCK:
+        entry = _CACHE.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= monotonic():
+            del _CACHE[key]
+            return None
+        _CACHE.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(key: Tuple[str, str, Any], value: Any) -> None:
+    if value is None:
+        return
+    with _CACHE_LOCK:
+        _CACHE[key] = (monotonic() + _CACHE_TTL_S, value)
+        _CACHE.move_to_end(key)
+        if len(_CACHE) > _CACHE_MAX:
+            _CACHE.popitem(last=False)
+
+
+def _cache_pop(key: Tuple[str, str, Any]) -> None:
+    with _CACHE_LOCK:
+        _CACHE.pop(key, None)
+
+
+# Boolean per-chat settings, packed into sessions.flags so a new one needs
+# no schema change.
+SESSION_FLAG_INCLUDE_SQL = 1
+
+# Bumped whenever _SCHEMA_SQL changes; stored in PRAGMA user_version so a
+# warm start is a single pragma read.
+_SCHEMA_VERSION = 2
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS dsns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    dsn TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL,
+    dsn_id INTEGER,
+    FOREIGN KEY (dsn_id) REFERENCES dsns(id)
+);
+CREATE TABLE IF NOT EXISTS restaurants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    dsn_id INTEGER NOT NULL,
+    UNIQUE (name, dsn_id),
+    FOREIGN KEY (dsn_id) REFERENCES dsns(id)
+);
+CREATE TABLE IF NOT EXISTS user_restaurants (
+    user_id INTEGER NOT NULL,
+    restaurant_id INTEGER NOT NULL,
+    UNIQUE (user_id, restaurant_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (restaurant_id) REFERENCES restaurants(id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    selected_restaurants TEXT,
+    language TEXT,
+    flags INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+-- Restaurant lookups filter on dsn_id first; UNIQUE (name, dsn_id) can't
+-- serve that. user_restaurants is already covered by its
+-- UNIQUE (user_id, restaurant_id) index.
+CREATE INDEX IF NOT EXISTS ix_restaurants_dsn_name ON restaurants (dsn_id, name);
+"""
+
+
 def init_db(db_path: str = DEFAULT_DB_PATH) -> None:
-    with _connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS dsns (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                dsn TEXT NOT NULL
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                dsn_id INTEGER,
-                FOREIGN KEY (dsn_id) REFERENCES dsns(id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS restaurants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                dsn_id INTEGER NOT NULL,
-                UNIQUE (name, dsn_id),
-                FOREIGN KEY (dsn_id) REFERENCES dsns(id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_restaurants (
-                user_id INTEGER NOT NULL,
-                restaurant_id INTEGER NOT NULL,
-                UNIQUE (user_id, restaurant_id),
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (restaurant_id) REFERENCES restaurants(id)
-            );
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS sessions (
-                chat_id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                selected_restaurants TEXT,
-                language TEXT,
-                include_sql INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            );
-            """
-        )
-        # lightweight migration for existing DBs
-        cur.execute("PRAGMA table_info(sessions)")
-        cols = {row[1] for row in cur.fetchall()}
-        if "language" not in cols:
-            cur.execute("ALTER TABLE sessions ADD COLUMN language TEXT;")
-        if "include_sql" not in cols:
-            cur.execute("ALTER TABLE sessions ADD COLUMN include_sql INTEGER;")
-        conn.commit()
+    conn = _connect(db_path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= _SCHEMA_VERSION:
+        return
+    # persistent per database file: readers no longer block the writer.
+    # Can't change journal mode inside a transaction, so it goes first.
+    conn.execute("PRAGMA journal_mode = WAL;")
+    # lightweight migration for DBs created before user_version was tracked
+    # (empty when the sessions table doesn't exist yet)
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+    migration = ""
+    if cols and "language" not in cols:
+        migration += "ALTER TABLE sessions ADD COLUMN language TEXT;\n"
+    if cols and "flags" not in cols:
+        migration += "ALTER TABLE sessions ADD COLUMN flags INTEGER NOT NULL DEFAULT 0;\n"
+        if "include_sql" in cols:
+            # the old per-flag column is left in place, unused
+            migration += f"UPDATE sessions SET flags = COALESCE(include_sql, 0) * {SESSION_FLAG_INCLUDE_SQL};\n"
+    conn.executescript(
+        "BEGIN;\n"
+        + migration
+        + _SCHEMA_SQL
+        + f"PRAGMA user_version = {_SCHEMA_VERSION};\n"
+        + "COMMIT;"
+    )
+    # refresh planner statistics where they're stale (cheap when not)
+    conn.execute("PRAGMA optimize;")
 
 
 def create_dsn(name: str, dsn: str, db_path: str = DEFAULT_DB_PATH) -> int:
@@ -103,7 +202,7 @@ def create_dsn(name: str, dsn: str, db_path: str = DEFAULT_DB_PATH) -> int:
 
 
 def get_dsn_by_name(name: str, db_path: str = DEFAULT_DB_PATH) -> Optional[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM dsns WHERE name = ?", (name,))
         row = cur.fetchone()
@@ -111,18 +210,24 @@ def get_dsn_by_name(name: str, db_path: str = DEFAULT_DB_PATH) -> Optional[Dict[
 
 
 def list_dsns(db_path: str = DEFAULT_DB_PATH) -> List[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM dsns ORDER BY name")
         return [dict(r) for r in cur.fetchall()]
 
 
 def get_dsn_by_id(dsn_id: int, db_path: str = DEFAULT_DB_PATH) -> Optional[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    key = (db_path, "dsn", dsn_id)
+    dsn = _cache_get(key)
+    if dsn is not None:
+        return dsn
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM dsns WHERE id = ?", (dsn_id,))
         row = cur.fetchone()
-        return dict(row) if row else None
+        dsn = dict(row) if row else None
+    _cache_put(key, dsn)
+    return dsn
 
 
 def sync_restaurants_from_dsn(dsn_id: int, db_path: str = DEFAULT_DB_PATH) -> int:
@@ -130,25 +235,23 @@ def sync_restaurants_from_dsn(dsn_id: int, db_path: str = DEFAULT_DB_PATH) -> in
     if not dsn:
         raise ValueError("DSN not found")
     dsn_value = dsn["dsn"]
-    with psycopg.connect(dsn_value) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT DISTINCT restaurant FROM sales ORDER BY restaurant;")
-            rows = cur.fetchall()
+    # Read everything from Postgres first, then write in one short SQLite
+    # transaction: holding the write lock while a slow tenant streams rows
+    # would make bot session writes fail with "database is locked".
+    with psycopg.connect(dsn_value) as pg_conn:
+        with pg_conn.cursor() as pg_cur:
+            pg_cur.execute("SELECT DISTINCT restaurant FROM sales WHERE restaurant IS NOT NULL")
+            params = [(r[0], dsn_id) for r in pg_cur]
 
-    names = [r[0] for r in rows if r and r[0] is not None]
     with _connect(db_path) as conn:
         cur = conn.cursor()
-        for name in names:
-            cur.execute(
-                "INSERT OR IGNORE INTO restaurants (name, dsn_id) VALUES (?, ?)",
-                (name, dsn_id),
-            )
+        cur.executemany("INSERT OR IGNORE INTO restaurants (name, dsn_id) VALUES (?, ?)", params)
         conn.commit()
-    return len(names)
+    return len(params)
 
 
 def list_restaurants_by_dsn(dsn_id: int, db_path: str = DEFAULT_DB_PATH) -> List[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM restaurants WHERE dsn_id = ? ORDER BY name", (dsn_id,))
         return [dict(r) for r in cur.fetchall()]
@@ -171,52 +274,97 @@ def create_user(
         return int(cur.lastrowid)
 
 
+_Q_USER_BY_EMAIL = "SELECT id, email, password_hash, role, dsn_id FROM users WHERE email = ?"
+_Q_USER_BY_ID = "SELECT id, email, password_hash, role, dsn_id FROM users WHERE id = ?"
+
+
 def get_user_by_email(email: str, db_path: str = DEFAULT_DB_PATH) -> Optional[User]:
-    with _connect(db_path) as conn:
+    key = (db_path, "user_email", email)
+    user = _cache_get(key)
+    if user is not None:
+        return user
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE email = ?", (email,))
+        # plain tuples: the SELECT lists User's fields in order
+        cur.row_factory = None
+        cur.execute(_Q_USER_BY_EMAIL, (email,))
         row = cur.fetchone()
         if not row:
             return None
-        return User(
-            id=row["id"],
-            email=row["email"],
-            password_hash=row["password_hash"],
-            role=row["role"],
-            dsn_id=row["dsn_id"],
-        )
+        user = User(*row)
+    _cache_put(key, user)
+    return user
 
 
 def get_user_by_id(user_id: int, db_path: str = DEFAULT_DB_PATH) -> Optional[User]:
-    with _connect(db_path) as conn:
+    key = (db_path, "user", user_id)
+    user = _cache_get(key)
+    if user is not None:
+        return user
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        # plain tuples: the SELECT lists User's fields in order
+        cur.row_factory = None
+        cur.execute(_Q_USER_BY_ID, (user_id,))
         row = cur.fetchone()
         if not row:
             return None
-        return User(
-            id=row["id"],
-            email=row["email"],
-            password_hash=row["password_hash"],
-            role=row["role"],
-            dsn_id=row["dsn_id"],
+        user = User(*row)
+    _cache_put(key, user)
+    return user
+
+
+def get_user_with_dsn(
+    user_id: int, db_path: str = DEFAULT_DB_PATH
+) -> Tuple[Optional[User], Optional[Dict[str, Any]]]:
+    """The user and their DSN row (or None): from the cache, else one query."""
+    user = _cache_get((db_path, "user", user_id))
+    if user is not None:
+        if user.dsn_id is None:
+            return user, None
+        dsn = _cache_get((db_path, "dsn", user.dsn_id))
+        if dsn is not None:
+            return user, dsn
+    with _connect(db_path, readonly=True) as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(
+            """
+            SELECT u.id, u.email, u.password_hash, u.role, u.dsn_id, d.name, d.dsn
+            FROM users u
+            LEFT JOIN dsns d ON d.id = u.dsn_id
+            WHERE u.id = ?
+            """,
+            (user_id,),
         )
+        row = cur.fetchone()
+        if not row:
+            return None, None
+        *fields, dsn_name, dsn_value = row
+        user = User(*fields)
+        dsn = None
+        if dsn_value is not None:
+            dsn = {"id": user.dsn_id, "name": dsn_name, "dsn": dsn_value}
+    _cache_put((db_path, "user", user_id), user)
+    if dsn is not None:
+        _cache_put((db_path, "dsn", dsn["id"]), dsn)
+    return user, dsn
 
 
 def set_user_restaurants(user_id: int, restaurant_ids: List[int], db_path: str = DEFAULT_DB_PATH) -> None:
     with _connect(db_path) as conn:
         cur = conn.cursor()
+        # delete + insert commit together as one transaction
         cur.execute("DELETE FROM user_restaurants WHERE user_id = ?", (user_id,))
-        for rid in restaurant_ids:
-            cur.execute(
-                "INSERT OR IGNORE INTO user_restaurants (user_id, restaurant_id) VALUES (?, ?)",
-                (user_id, rid),
-            )
+        cur.executemany(
+            "INSERT OR IGNORE INTO user_restaurants (user_id, restaurant_id) VALUES (?, ?)",
+            [(user_id, rid) for rid in restaurant_ids],
+        )
         conn.commit()
 
 
 def list_user_restaurants(user_id: int, db_path: str = DEFAULT_DB_PATH) -> List[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
         cur.execute(
             """
@@ -230,41 +378,101 @@ def list_user_restaurants(user_id: int, db_path: str = DEFAULT_DB_PATH) -> List[
         return [dict(r) for r in cur.fetchall()]
 
 
+# A user's explicit grants if they have any, otherwise every restaurant of
+# their DSN -- decided in one statement. Bind (user_id, dsn_id).
+_Q_ACCESSIBLE = """
+    WITH granted AS (
+        SELECT r.* FROM restaurants r
+        JOIN user_restaurants ur ON ur.restaurant_id = r.id
+        WHERE ur.user_id = ?
+    )
+    SELECT {cols} FROM granted
+    UNION ALL
+    SELECT {cols} FROM restaurants
+    WHERE dsn_id = ? AND NOT EXISTS (SELECT 1 FROM granted)
+    ORDER BY name
+"""
+_Q_ACCESSIBLE_ROWS = _Q_ACCESSIBLE.format(cols="*")
+_Q_ACCESSIBLE_NAMES = _Q_ACCESSIBLE.format(cols="name")
+
+
 def list_accessible_restaurants(user: User, db_path: str = DEFAULT_DB_PATH) -> List[Dict[str, Any]]:
     if user.dsn_id is None:
         return []
-    restricted = list_user_restaurants(user.id, db_path=db_path)
-    if restricted:
-        return restricted
-    return list_restaurants_by_dsn(user.dsn_id, db_path=db_path)
+    with _connect(db_path, readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(_Q_ACCESSIBLE_ROWS, (user.id, user.dsn_id))
+        return [dict(r) for r in cur.fetchall()]
 
 
-def set_session(chat_id: int, user_id: int, selected_restaurants: Optional[str], db_path: str = DEFAULT_DB_PATH) -> None:
-    with _connect(db_path) as conn:
+def list_accessible_restaurant_names(user: User, db_path: str = DEFAULT_DB_PATH) -> List[str]:
+    """Names only, same rules as list_accessible_restaurants."""
+    if user.dsn_id is None:
+        return []
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO sessions (chat_id, user_id, selected_restaurants) VALUES (?, ?, ?) "
-            "ON CONFLICT(chat_id) DO UPDATE SET user_id = excluded.user_id, selected_restaurants = excluded.selected_restaurants",
-            (chat_id, user_id, selected_restaurants),
+        cur.execute(_Q_ACCESSIBLE_NAMES, (user.id, user.dsn_id))
+        return [r[0] for r in cur.fetchall()]
+
+
+def list_restaurant_id_by_name(dsn_id: int, db_path: str = DEFAULT_DB_PATH) -> Dict[str, int]:
+    """{name: id} for a DSN's restaurants, in name order."""
+    with _connect(db_path, readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT name, id FROM restaurants WHERE dsn_id = ? ORDER BY name", (dsn_id,))
+        return {r[0]: r[1] for r in cur.fetchall()}
+
+
+_SESSION_FIELDS = frozenset({"user_id", "selected_restaurants", "language", "flags"})
+
+
+def update_session(chat_id: int, db_path: str = DEFAULT_DB_PATH, **fields: Any) -> None:
+    """
+    Write any subset of session columns in one statement. With user_id it's
+    an upsert; without, the chat must already have a session (user_id is
+    NOT NULL), so it's a plain UPDATE that no-ops otherwise.
+    """
+    unknown = set(fields) - _SESSION_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown session fields: {sorted(unknown)}")
+    if not fields:
+        return
+    cols = list(fields)
+    values = [fields[c] for c in cols]
+    if "user_id" in fields:
+        sql = (
+            f"INSERT INTO sessions (chat_id, {', '.join(cols)}) VALUES (?{', ?' * len(cols)}) "
+            f"ON CONFLICT(chat_id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in cols)}"
         )
-        conn.commit()
+        params = [chat_id] + values
+    else:
+        sql = f"UPDATE sessions SET {', '.join(f'{c} = ?' for c in cols)} WHERE chat_id = ?"
+        params = values + [chat_id]
+    with _connect(db_path) as conn:
+        conn.execute(sql, params)
+    _cache_pop((db_path, "session", chat_id))
+
+
+def set_session(chat_id: int, user_id: int, selected_restaurants: Optional[str], db_path: str = DEFAULT_DB_PATH) -> None:
+    update_session(chat_id, db_path, user_id=user_id, selected_restaurants=selected_restaurants)
 
 
 def set_session_language(chat_id: int, language: str, db_path: str = DEFAULT_DB_PATH) -> None:
-    with _connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE sessions SET language = ? WHERE chat_id = ?", (language, chat_id))
-        conn.commit()
+    update_session(chat_id, db_path, language=language)
 
 
-def set_session_include_sql(chat_id: int, include_sql: bool, db_path: str = DEFAULT_DB_PATH) -> None:
+def set_session_flag(chat_id: int, flag: int, on: bool, db_path: str = DEFAULT_DB_PATH) -> None:
+    """Set or clear one SESSION_FLAG_* bit; no-op without an existing session."""
     with _connect(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE sessions SET include_sql = ? WHERE chat_id = ?",
-            (1 if include_sql else 0, chat_id),
+        conn.execute(
+            "UPDATE sessions SET flags = (flags & ~?) | ? WHERE chat_id = ?",
+            (flag, flag if on else 0, chat_id),
         )
-        conn.commit()
+    _cache_pop((db_path, "session", chat_id))
+
+
+def set_session_include_sql(chat_id: int, include_sql: bool, db_path: str = DEFAULT_DB_PATH) -> None:
+    set_session_flag(chat_id, SESSION_FLAG_INCLUDE_SQL, include_sql, db_path)
 
 
 def clear_session(chat_id: int, db_path: str = DEFAULT_DB_PATH) -> None:
@@ -272,24 +480,35 @@ def clear_session(chat_id: int, db_path: str = DEFAULT_DB_PATH) -> None:
         cur = conn.cursor()
         cur.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
         conn.commit()
+    _cache_pop((db_path, "session", chat_id))
 
 
 def get_session(chat_id: int, db_path: str = DEFAULT_DB_PATH) -> Optional[Dict[str, Any]]:
-    with _connect(db_path) as conn:
+    key = (db_path, "session", chat_id)
+    sess = _cache_get(key)
+    if sess is not None:
+        return sess
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM sessions WHERE chat_id = ?", (chat_id,))
+        cur.execute(
+            "SELECT chat_id, user_id, selected_restaurants, language, flags FROM sessions WHERE chat_id = ?",
+            (chat_id,),
+        )
         row = cur.fetchone()
-        return dict(row) if row else None
+        sess = dict(row) if row else None
+    _cache_put(key, sess)
+    return sess
 
 
 def get_restaurant_ids_by_names(dsn_id: int, names: List[str], db_path: str = DEFAULT_DB_PATH) -> List[int]:
     if not names:
         return []
-    with _connect(db_path) as conn:
+    with _connect(db_path, readonly=True) as conn:
         cur = conn.cursor()
-        placeholders = ",".join("?" for _ in names)
+        # names travel as one JSON array, so the SQL text (and its cached
+        # prepared statement) is the same for any number of names
         cur.execute(
-            f"SELECT id FROM restaurants WHERE dsn_id = ? AND name IN ({placeholders})",
-            [dsn_id] + names,
+            "SELECT id FROM restaurants WHERE dsn_id = ? AND name IN (SELECT value FROM json_each(?))",
+            (dsn_id, json.dumps(names)),
         )
         return [r["id"] for r in cur.fetchall()]
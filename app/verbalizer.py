@@ -1,39 +1,78 @@
 # app/verbalizer.py
 from __future__ import annotations
 
+import re
 from datetime import datetime, date
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
+
+
+_ISO_DATE_PREFIX_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
 
 
 def _to_date_str(x: Any) -> str:
     """Normalize a period value (datetime/date/str) to YYYY-MM-DD string."""
     if isinstance(x, datetime):
-        return x.strftime("%Y-%m-%d")
+        return x.date().isoformat()
     if isinstance(x, date):
-        return x.strftime("%Y-%m-%d")
+        return x.isoformat()
 
     s = str(x)
+    # ISO-looking strings: the parse below would either return this same
+    # prefix or fail over to s[:10], so skip it.
+    if _ISO_DATE_PREFIX_RE.match(s):
+        return s[:10]
     try:
         return datetime.fromisoformat(s.replace("Z", "")).strftime("%Y-%m-%d")
     except Exception:
         return s[:10] if len(s) >= 10 else s
 
 
+def _fmt_date(x: Any) -> str:
+    return x.isoformat() if type(x) is date else _to_date_str(x)
+
+
+def _fmt_iso_str(x: Any) -> str:
+    return x[:10] if type(x) is str and _ISO_DATE_PREFIX_RE.match(x) else _to_date_str(x)
+
+
+def _period_formatter(sample: Any) -> Callable[[Any], str]:
+    """
+    _to_date_str specialized for a column whose first value is `sample`
+    (drivers return one type per column); any other value still goes
+    through _to_date_str.
+    """
+    if type(sample) is date:
+        return _fmt_date
+    if type(sample) is str:
+        return _fmt_iso_str
+    return _to_date_str
+
+
 def _fmt_number(x: Any) -> str:
+    if isinstance(x, (int, float)):
+        # common case: no float() round trip, no exception machinery
+        return format(x, ",.0f")
     try:
         return f"{float(x):,.0f}"
     except Exception:
         return str(x)
 
 
+def _bulleted(header: str, lines: List[str], footer: str = "") -> str:
+    """header + one line per bullet + footer, built in a single pass."""
+    body = "\n".join(lines)
+    return f"{header}{body}{footer}"
+
+
+_NON_DIMENSION_KEYS = frozenset({"period", "value"})
+
+
 def _find_dimension_key(rows: List[Dict[str, Any]]) -> Optional[str]:
     """Find first non-(period,value) column to use as label in rankings."""
     if not rows:
         return None
-    for k in rows[0].keys():
-        if k not in ("period", "value"):
-            return k
-    return None
+    # column order matters (first dimension wins), so no set difference here
+    return next((k for k in rows[0] if k not in _NON_DIMENSION_KEYS), None)
 
 
 def verbalize_answer(question: str, plan: Any, rows: List[Dict[str, Any]], language: str = "en") -> str:
@@ -66,10 +105,11 @@ def verbalize_answer(question: str, plan: Any, rows: List[Dict[str, Any]], langu
     # Comparison mode (2 specific days)
     # ----------------------------
     if comparison_dates and len(comparison_dates) == 2 and "period" in rows[0] and "value" in rows[0]:
-        # Map returned rows by YYYY-MM-DD
+        # Map returned rows by YYYY-MM-DD (each row's day computed once)
+        fmt_day = _period_formatter(rows[0]["period"])
+        days = [fmt_day(r["period"]) for r in rows]
         by_day: Dict[str, float] = {}
-        for r in rows:
-            d = _to_date_str(r["period"])
+        for d, r in zip(days, rows):
             by_day[d] = float(r["value"])
 
         d1 = str(comparison_dates[0])
@@ -80,19 +120,21 @@ def verbalize_answer(question: str, plan: Any, rows: List[Dict[str, Any]], langu
 
         # Fallback: if not found exactly, use chronological first/last
         if v1 is None or v2 is None:
-            rows_sorted = sorted(rows, key=lambda r: _to_date_str(r["period"]))
-            if len(rows_sorted) >= 2:
-                d1 = _to_date_str(rows_sorted[0]["period"])
-                d2 = _to_date_str(rows_sorted[-1]["period"])
-                v1 = float(rows_sorted[0]["value"])
-                v2 = float(rows_sorted[-1]["value"])
+            if len(rows) >= 2:
+                # Only the ends are needed: first earliest and last latest
+                # row, as a stable sort would give, without sorting.
+                lo = min(range(len(rows)), key=days.__getitem__)
+                hi = max(reversed(range(len(rows))), key=days.__getitem__)
+                d1, d2 = days[lo], days[hi]
+                v1 = float(rows[lo]["value"])
+                v2 = float(rows[hi]["value"])
 
         if v1 is None or v2 is None:
             # If still missing, just show what we have
-            lines = [f"• {_to_date_str(r['period'])}: {_fmt_number(r['value'])}" for r in rows]
-            return (
-                (f"Aquí está lo que encontré para **{question}**:\n\n" if language == "es" else f"Here’s what I found for **{question}**:\n\n")
-                + "\n".join(lines)
+            lines = [f"• {d}: {_fmt_number(r['value'])}" for d, r in zip(days, rows)]
+            return _bulleted(
+                f"Aquí está lo que encontré para **{question}**:\n\n" if language == "es" else f"Here’s what I found for **{question}**:\n\n",
+                lines,
             )
 
         diff = v2 - v1
@@ -134,16 +176,13 @@ def verbalize_answer(question: str, plan: Any, rows: List[Dict[str, Any]], langu
     # Time series mode
     # ----------------------------
     if "period" in rows[0] and "value" in rows[0]:
-        lines = []
-        for r in rows:
-            day = _to_date_str(r.get("period"))
-            val = _fmt_number(r.get("value"))
-            lines.append(f"• {day}: {val}")
+        fmt_day = _period_formatter(rows[0]["period"])
+        lines = [f"• {fmt_day(r.get('period'))}: {_fmt_number(r.get('value'))}" for r in rows]
 
-        return (
-            (f"Aquí está lo que encontré para **{question}**:\n\n" if language == "es" else f"Here’s what I found for **{question}**:\n\n")
-            + "\n".join(lines)
-            + ("\n\nAvísame si quieres profundizar más." if language == "es" else "\n\nLet me know if you want to explore this further.")
+        return _bulleted(
+            f"Aquí está lo que encontré para **{question}**:\n\n" if language == "es" else f"Here’s what I found for **{question}**:\n\n",
+            lines,
+            "\n\nAvísame si quieres profundizar más." if language == "es" else "\n\nLet me know if you want to explore this further.",
         )
 
     # ----------------------------
@@ -164,24 +203,20 @@ def verbalize_answer(question: str, plan: Any, rows: List[Dict[str, Any]], langu
             pct_str = "n/a" if pct is None else f"{float(pct) * 100:+.1f}%"
             lines.append(f"• {product}: Δ {delta} ({pct_str}) — recent {recent}, prior {prior}")
 
-        return (
-            (f"Aquí están los productos con mayor aumento para **{question}**:\n\n" if language == "es" else f"Here are the products with the biggest increase for **{question}**:\n\n")
-            + "\n".join(lines)
-            + ("\n\n¿Quieres que los ordene por % de cambio en vez de aumento absoluto?" if language == "es" else "\n\nWant me to rank by % change instead of absolute increase?")
+        return _bulleted(
+            f"Aquí están los productos con mayor aumento para **{question}**:\n\n" if language == "es" else f"Here are the products with the biggest increase for **{question}**:\n\n",
+            lines,
+            "\n\n¿Quieres que los ordene por % de cambio en vez de aumento absoluto?" if language == "es" else "\n\nWant me to rank by % change instead of absolute increase?",
         )
 
     # Standard ranking: label + value
     if dim_key and "value" in rows[0]:
-        lines = []
-        for r in rows[:20]:
-            label = str(r.get(dim_key))
-            val = _fmt_number(r.get("value"))
-            lines.append(f"• {label}: {val}")
+        lines = [f"• {r.get(dim_key)}: {_fmt_number(r.get('value'))}" for r in rows[:20]]
 
-        return (
-            (f"Aquí está el desglose para **{question}**:\n\n" if language == "es" else f"Here’s the breakdown for **{question}**:\n\n")
-            + "\n".join(lines)
-            + ("\n\n¿Quieres que agregue un filtro de fechas o compare períodos?" if language == "es" else "\n\nWant me to add a date filter or compare periods?")
+        return _bulleted(
+            f"Aquí está el desglose para **{question}**:\n\n" if language == "es" else f"Here’s the breakdown for **{question}**:\n\n",
+            lines,
+            "\n\n¿Quieres que agregue un filtro de fechas o compare períodos?" if language == "es" else "\n\nWant me to add a date filter or compare periods?",
         )
 
     # ----------------------------